@@ -0,0 +1,87 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_export
+from frauds.engine import COUNTER_FEATURES, DISTINCT_FEATURES, active_features, frame_matrix, prepare
+from frauds.providers import PROVIDERS
+
+# Сравнение расчета признаков: по groupby + map на каждый признак (как было)
+# и матрица признаков по email из пайплайна (frauds.engine.frame_matrix: один
+# проход по целочисленным кодам). Оба варианта — от сырой выгрузки, с prepare;
+# матрица считает все признаки провайдера, включая флаги и признаки скорости
+#
+#   python -m benchmarks.bench_features --rows 1000000 --emails 200000
+
+
+def features_groupby_map(frame, features):
+    rows = pd.DataFrame(index=frame.index)
+    for feature in features:
+        if feature in DISTINCT_FEATURES:
+            keys, value, fill = DISTINCT_FEATURES[feature]
+            counts = frame.groupby(keys)[value].nunique()
+            if len(keys) == 1:
+                values = frame[keys[0]].map(counts)
+            else:
+                values = pd.Series(frame.set_index(keys).index.map(counts), index=frame.index)
+            rows[feature] = values if fill is None else values.fillna(fill)
+        elif feature == 'failure_ratio':
+            declines = frame[frame['is_decline']].groupby('email').size()
+            successes = frame[frame['is_success']].groupby('email').size()
+            rows[feature] = frame['email'].map(declines / successes).fillna(0)
+        elif feature in COUNTER_FEATURES:
+            flagged = frame[frame[COUNTER_FEATURES[feature][0]]]
+            rows[feature] = frame['email'].map(flagged.groupby('email').size()).fillna(0)
+    return rows
+
+
+def groupby_map_emails(spec, df, features):
+    # Прежний расчет, значения признаков по первой строке каждого email
+    frame = prepare(spec, df)
+    rows = features_groupby_map(frame, features)
+    first = frame['email'].astype(object).dropna().drop_duplicates()
+    return rows.loc[first.index].set_axis(first.to_numpy())
+
+
+def _best_of(repeat, fn, *args):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк признаков по email")
+    parser.add_argument('--provider', default='upgate', choices=['upgate', 'unlimit', 'payabl', 'centrobill'])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--emails', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    spec = PROVIDERS[f"df_{args.provider}"]
+    df = make_export(args.provider, args.rows, emails=args.emails)
+    features = [feature for feature in active_features(spec, prepare(spec, df))
+                if feature in DISTINCT_FEATURES or feature in COUNTER_FEATURES]
+
+    old_time, old = _best_of(args.repeat, groupby_map_emails, spec, df, features)
+    new_time, matrix = _best_of(args.repeat, frame_matrix, spec, df)
+
+    old = old.reindex(matrix.emails)
+    for feature in features:
+        new = matrix.values[:, matrix.features.index(feature)]
+        if not np.allclose(old[feature].to_numpy(dtype=float), new, equal_nan=True):
+            raise SystemExit(f"расхождение в признаке {feature}")
+
+    print(f"{args.provider}: {len(df)} строк, {len(matrix.emails)} email, {len(features)} признаков")
+    print(f"groupby + map:     {old_time:8.3f} с")
+    print(f"frame_matrix:      {new_time:8.3f} с")
+    print(f"ускорение:         {old_time / new_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
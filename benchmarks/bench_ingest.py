@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import write_export
+from frauds.ingest import CSV_ENGINE, read_export
+from frauds.providers import PROVIDERS
+
+# Сравнение чтения выгрузки: весь файл через pd.read_csv(path, sep) (как было)
+# и только нужные колонки с типами (frauds.ingest.read_export). Каждое чтение
+# идет в отдельном процессе, чтобы пиковая память не смешивалась
+#
+#   python -m benchmarks.bench_ingest --rows 1000000 10000000 --extra-columns 60
+
+
+def measure(mode, provider, path):
+    spec = PROVIDERS[f"df_{provider}"]
+    started = time.perf_counter()
+    if mode == 'old':
+        df = pd.read_csv(path, sep=spec.sep)
+    else:
+        df = read_export(spec, path)
+    elapsed = time.perf_counter() - started
+    return {
+        'seconds': elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'frame_mb': df.memory_usage(deep=True).sum() / 2 ** 20,
+        'columns': df.shape[1],
+    }
+
+
+def _run_child(mode, provider, path):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_ingest', '--measure', mode, '--provider', provider, path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк чтения выгрузок")
+    parser.add_argument('--provider', default='upgate', choices=['upgate', 'unlimit', 'payabl', 'centrobill'])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--extra-columns', type=int, default=60)
+    parser.add_argument('--dir', default=None, help="куда писать синтетические файлы (по умолчанию временная папка)")
+    parser.add_argument('--measure', choices=['old', 'new'], help=argparse.SUPPRESS)
+    parser.add_argument('path', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.provider, args.path)))
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        print(f"движок: {CSV_ENGINE}, провайдер: {args.provider}, лишних колонок: {args.extra_columns}")
+        for rows in args.rows:
+            path = write_export(args.provider, rows, directory, extra_columns=args.extra_columns)
+            size_mb = os.path.getsize(path) / 2 ** 20
+            old, new = _run_child('old', args.provider, path), _run_child('new', args.provider, path)
+            os.remove(path)
+
+            print(f"\n{rows} строк, файл {size_mb:.0f} МБ")
+            print(f"{'':12}{'время, с':>10}{'пик RSS, МБ':>14}{'кадр, МБ':>11}{'колонок':>10}")
+            for name, stats in (('read_csv', old), ('read_export', new)):
+                print(f"{name:12}{stats['seconds']:>10.2f}{stats['peak_rss_mb']:>14.0f}"
+                      f"{stats['frame_mb']:>11.0f}{stats['columns']:>10}")
+            print(f"ускорение {old['seconds'] / new['seconds']:.1f}x, "
+                  f"память кадра в {old['frame_mb'] / new['frame_mb']:.1f} раз меньше")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import time
+
+import numpy as np
+
+import pandas as pd
+
+from frauds.rings import components, find_rings
+
+# Union-find на массивах (frauds.rings.components) на случайных графах: время
+# должно расти почти линейно по числу ребер. Компоненты сверяются с обычным
+# union-find на Python на небольшом графе. Отдельно — худшие случаи для
+# подвешивания корней: звезда, центр которой — вершина с наибольшим номером, а
+# листья идут по возрастанию, и find_rings с email-хабом, который делит по карте
+# с каждым из остальных email. Время на них тоже должно расти линейно по размеру
+#
+#   python -m benchmarks.bench_rings --edges 1000000 5000000 20000000 --star 2000 16000 1000000
+
+
+def python_components(n, left, right):
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    return np.array([find(x) for x in range(n)])
+
+
+def random_graph(rng, n_edges, degree):
+    # Двудольный граф email — сущность, как в frauds.rings: в среднем degree ребер на вершину
+    n = max(int(n_edges / degree), 2)
+    emails = n // 2
+    left = rng.integers(0, emails, n_edges)
+    right = rng.integers(emails, n, n_edges)
+    return n, left, right
+
+
+def sorted_star(n):
+    # Центр n - 1, листья 0..n - 2 по возрастанию
+    return n, np.arange(n - 1), np.full(n - 1, n - 1)
+
+
+def hub_email_files(n):
+    # Email user0..user{n-1} и последним — hub; карта i общая у user{i} и hub
+    emails = np.array([f"user{i}@mail.com" for i in range(n)] + ['hub@mail.com'], dtype=object)
+    cards = np.array([f"400000:{i:04d}" for i in range(n)], dtype=object)
+    email_codes = np.concatenate([np.arange(n), np.full(n, n)])
+    card_codes = np.concatenate([np.arange(n), np.arange(n)])
+    scores = pd.Series(1.0, index=emails)
+    return [('payabl', emails, {'card': (email_codes, card_codes, cards)}, scores)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска связных компонент")
+    parser.add_argument('--edges', type=int, nargs='+', default=[1_000_000, 5_000_000, 20_000_000])
+    # Меньше 1 — много мелких компонент, как у колец; больше — одна большая
+    parser.add_argument('--degree', type=float, nargs='+', default=[0.8, 2.0])
+    parser.add_argument('--star', type=int, nargs='+', default=[2_000, 16_000, 1_000_000],
+                        help="размеры звезды и email-хаба")
+    parser.add_argument('--check-edges', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    for degree in args.degree:
+        n, left, right = random_graph(rng, args.check_edges, degree)
+        ok = np.array_equal(components(n, left, right), python_components(n, left, right))
+        print(f"сверка с Python, {args.check_edges} ребер, степень {degree}: {'ok' if ok else 'РАСХОЖДЕНИЕ'}")
+        if not ok:
+            raise SystemExit(1)
+    n, left, right = sorted_star(1000)
+    ok = np.array_equal(components(n, left, right), python_components(n, left, right))
+    print(f"сверка с Python, звезда из 1000 вершин: {'ok' if ok else 'РАСХОЖДЕНИЕ'}")
+    if not ok:
+        raise SystemExit(1)
+
+    for size in args.star:
+        n, left, right = sorted_star(size)
+        started = time.perf_counter()
+        components(n, left, right)
+        star = time.perf_counter() - started
+        files = hub_email_files(size)
+        started = time.perf_counter()
+        rings = find_rings(files)
+        hub = time.perf_counter() - started
+        if len(rings) != 1 or rings['emails'].iloc[0] != size + 1:
+            print(f"email-хаб из {size} email: ожидалось одно кольцо из {size + 1} email")
+            raise SystemExit(1)
+        print(f"{size:>11} вершин: звезда {star:6.2f} с, find_rings с email-хабом {hub:6.2f} с")
+
+    for degree in args.degree:
+        for n_edges in args.edges:
+            n, left, right = random_graph(rng, n_edges, degree)
+            started = time.perf_counter()
+            roots = components(n, left, right)
+            elapsed = time.perf_counter() - started
+            print(f"{n_edges:>11} ребер, {n:>10} вершин, степень {degree}: {elapsed:6.2f} с, "
+                  f"{elapsed / n_edges * 1e9:5.0f} нс на ребро, компонент {len(np.unique(roots))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import write_export
+from frauds import metrics
+from frauds.pipelines import score_file
+from frauds.providers import PROVIDERS
+from frauds.streaming import DEFAULT_CHUNKSIZE
+from frauds.tasks import streaming_chunksize
+
+# Проверка приближенного режима (KMV-скетчи) против обычного пути score_file.
+# Скетчи работают только в потоковом режиме, поэтому по умолчанию (--threshold-mb 0)
+# он включается для любого файла; файл меньше порога — ошибка, а не сравнение
+# расчета с самим собой. Печатает время, пиковую память
+# (RSS, каждый расчет — в отдельном процессе) и долю общих email в top-N
+# рейтинга. Завершается с кодом 1, если совпадение top-N ниже --min-overlap
+#
+#   python -m benchmarks.check_approx --rows 2000000 --emails 20000 --error 0.05 --threshold-mb 100
+
+
+def measure(path, out_dir, chunksize, error):
+    metrics.start()
+    started = time.perf_counter()
+    result_path, _ = score_file(path, out_dir, chunksize, distinct_error=error)
+    return {
+        'wall': time.perf_counter() - started,
+        'peak_rss_mb': metrics.peak_rss_mb(),
+        'result_path': result_path,
+    }
+
+
+def _run_child(path, out_dir, chunksize, error):
+    command = [sys.executable, '-m', 'benchmarks.check_approx', '--measure', out_dir,
+               '--chunksize', str(chunksize or 0), '--error', str(error or 0), path]
+    return json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+
+
+def top_overlap(exact, approx, spec, top):
+    exact_top = set(exact[spec.email_column].head(top))
+    approx_top = set(approx[spec.email_column].head(top))
+    return len(exact_top & approx_top) / max(len(exact_top), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Приближенный подсчет уникальных значений против обычного")
+    parser.add_argument('--providers', nargs='+', default=['upgate', 'unlimit', 'payabl', 'centrobill'])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--emails', type=int, default=None, help="меньше email — больше значений на ключ")
+    parser.add_argument('--error', type=float, default=0.05)
+    parser.add_argument('--top', type=int, default=500)
+    parser.add_argument('--min-overlap', type=float, default=0.9)
+    parser.add_argument('--threshold-mb', type=int, default=0, help="порог потокового режима (в боте 200)")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('path', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.path, args.measure, args.chunksize or None, args.error or None)))
+        return
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for provider in args.providers:
+            spec = PROVIDERS[f"df_{provider}"]
+            path = write_export(provider, args.rows, directory, emails=args.emails)
+            chunksize = streaming_chunksize(path, args.threshold_mb, args.chunksize)
+            if chunksize is None:
+                parser.error(f"{os.path.basename(path)} меньше --threshold-mb {args.threshold_mb}: "
+                             "файл читается целиком, приближенный режим не проверяется")
+            runs = {}
+            for mode, error in (('default', None), ('approx', args.error)):
+                out_dir = os.path.join(directory, mode)
+                os.makedirs(out_dir, exist_ok=True)
+                runs[mode] = _run_child(path, out_dir, chunksize, error)
+            exact, approx = (pd.read_csv(runs[mode]['result_path']) for mode in ('default', 'approx'))
+            overlap = top_overlap(exact, approx, spec, args.top)
+            failed |= overlap < args.min_overlap
+            default, approx = runs['default'], runs['approx']
+            print(f"{provider:11} top-{args.top}: {overlap:6.1%}   "
+                  f"время {default['wall']:6.2f} -> {approx['wall']:6.2f} с   "
+                  f"память {default['peak_rss_mb']:6.0f} -> {approx['peak_rss_mb']:6.0f} МБ")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
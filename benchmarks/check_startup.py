@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Проверка старта бота: время от запуска процесса до ответа на /start и модули,
+# импортированные к этому моменту (pandas, numpy и pyarrow во фронте быть не
+# должно — они импортируются в воркерах, см. frauds.tasks и frauds.warmup). Затем
+# время прогрева воркеров и первого расчета: сразу после старта без прогрева и
+# после прогрева. Каждый запуск — в новом процессе. Завершается с кодом 1, если
+# фронт импортировал тяжелые модули или медиана ответа дольше --max-reply-seconds
+#
+#   python -m benchmarks.check_startup --runs 5 --rows 50000
+#
+# Модуль импортирует только стандартную библиотеку: процесс замера — это бот
+
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow')
+
+
+class _Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append((time.time(), text))
+
+
+async def _measure(started, path, warm_up):
+    import telegram_bot_test as bot
+
+    message = _Message()
+    update = SimpleNamespace(message=message, effective_user=SimpleNamespace(id=1),
+                             effective_chat=SimpleNamespace(id=1))
+    await bot.start(update, None)
+    stats = {
+        'reply': message.replies[0][0] - started,
+        'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+    try:
+        if warm_up:
+            ready = time.perf_counter()
+            workers = await bot.scoring.warm_up()
+            stats['warm_up'], stats['workers'] = time.perf_counter() - ready, workers
+        job = time.perf_counter()
+        await bot.scoring.run(bot.score_job, path, os.path.dirname(path))
+        stats['first_job'] = time.perf_counter() - job
+    finally:
+        bot.scoring.shutdown()
+    return stats
+
+
+def _run_child(started, path, warm_up, directory):
+    # Бот стартует в пустой папке: очередь, кэш и temp/ не из рабочей копии
+    env = {**os.environ, 'BOT_TOKEN': 'check', 'JOBS_DB': os.path.join(directory, 'jobs.sqlite3'),
+           'RESULT_CACHE_MB': '0', 'METRICS_PATH': '', 'TEMP_SWEEP_INTERVAL': '0',
+           'PYTHONPATH': os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')]))}
+    command = [sys.executable, '-m', 'benchmarks.check_startup', '--measure', str(started), path]
+    if not warm_up:
+        command.append('--no-warm-up')
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=directory, env=env).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время старта бота и прогрева воркеров")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--provider', default='upgate')
+    parser.add_argument('--rows', type=int, default=50_000, help="строк в выгрузке первого расчета")
+    parser.add_argument('--max-reply-seconds', type=float, default=1.5)
+    parser.add_argument('--measure', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--no-warm-up', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('path', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(asyncio.run(_measure(args.measure, args.path, not args.no_warm_up))))
+        return
+
+    # Только в процессе проверки: синтетические данные импортируют pandas
+    from benchmarks.synthetic import write_export
+
+    failed = False
+    replies = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.abspath(write_export(args.provider, args.rows, directory))
+        for run in range(args.runs):
+            for warm_up in (False, True):
+                stats = _run_child(time.time(), path, warm_up, directory)
+                replies.append(stats['reply'])
+                failed |= bool(stats['heavy_modules'])
+                line = f"запуск {run + 1}: ответ на /start {stats['reply']:5.2f} с"
+                if warm_up:
+                    line += f", прогрев {stats['warm_up']:5.2f} с ({stats['workers']} воркеров)"
+                line += f", первый расчет {'после прогрева' if warm_up else 'без прогрева'} {stats['first_job']:5.2f} с"
+                if stats['heavy_modules']:
+                    line += f"   фронт импортировал: {', '.join(stats['heavy_modules'])}"
+                print(line)
+
+    reply = statistics.median(replies)
+    failed |= reply > args.max_reply_seconds
+    print(f"медиана ответа на /start: {reply:.2f} с (порог {args.max_reply_seconds:.2f} с)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.synthetic import make_export
+from frauds import metrics
+from frauds.engine import COUNTER_FEATURES, DISTINCT_FEATURES
+from frauds.providers import PROVIDERS
+from frauds.store import DEFAULT_SKETCH_SIZE, FeatureStore, incremental_matrix
+from frauds.streaming import BOUNDED_FEATURES, streaming_matrix
+
+# Хранилище признаков по дням: каждый день — новая выгрузка с теми же email,
+# картами и IP. Печатает время сохранения и чтения истории и размер базы после
+# каждого дня: они должны зависеть от числа сущностей, а не расти с каждым днем
+# на размер выгрузки. В конце пороги и признаки email последнего дня
+# сравниваются с потоковым расчетом по всем дням одним файлом (кроме
+# BOUNDED_FEATURES: в синтетике id операций повторяются между днями).
+# Завершается с кодом 1 при расхождении больше ошибки скетчей
+#
+#   python -m benchmarks.check_store --provider payabl --rows 1000000 --emails 20000 --days 6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время и размер хранилища признаков по дням")
+    parser.add_argument('--provider', default='payabl')
+    parser.add_argument('--rows', type=int, default=1_000_000, help="строк в выгрузке одного дня")
+    parser.add_argument('--emails', type=int, default=20_000)
+    parser.add_argument('--days', type=int, default=6)
+    parser.add_argument('--sketch-size', type=int, default=DEFAULT_SKETCH_SIZE)
+    args = parser.parse_args()
+
+    spec = PROVIDERS[f"df_{args.provider}"]
+    first_day = date(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        store = FeatureStore(os.path.join(directory, 'store.sqlite3'), sketch_size=args.sketch_size)
+        all_days = os.path.join(directory, 'all_days.csv')
+        for day in range(args.days):
+            path = os.path.join(directory, f"day{day}.csv")
+            df = make_export(args.provider, args.rows, emails=args.emails, part=day)
+            df.to_csv(path, sep=spec.sep, index=False)
+            df.to_csv(all_days, sep=spec.sep, index=False, mode='a', header=day == 0)
+            metrics.start()
+            matrix = incremental_matrix(path, spec, store, day=first_day + timedelta(days=day))
+            stages = metrics.take()
+            size_mb = os.path.getsize(store.path) / 2 ** 20
+            print(f"день {day + 1}: сохранение {stages['store']['seconds']:6.2f} с   "
+                  f"история {stages['history']['seconds']:6.2f} с   база {size_mb:7.1f} МБ")
+
+        expected = streaming_matrix(all_days, spec)
+    # Выше sketch_size уникальных значений на ключ счет приближенный: допуск — три
+    # стандартные ошибки KMV, для значений по email — не больше 1% email вне допуска
+    rtol = 3 / np.sqrt(store.sketch_size - 2)
+    rows = expected.emails.get_indexer(matrix.emails)
+    thresholds, expected_thresholds = matrix.thresholds(), expected.thresholds()
+    failed = False
+    for j, feature in enumerate(matrix.features):
+        if feature in BOUNDED_FEATURES:
+            continue
+        k = expected.features.index(feature)
+        # Значения по первой строке email (карта, сумма, гео) берутся из последнего
+        # дня, а не из первого дня, поэтому сравниваются только признаки самого email
+        if feature in COUNTER_FEATURES or DISTINCT_FEATURES.get(feature, (None,))[0] == ['email']:
+            outside = ~np.isclose(matrix.values[:, j], expected.values[rows, k], rtol=rtol, equal_nan=True)
+            if outside.mean() > 0.01:
+                print(f"{feature}: {outside.mean():.1%} email вне допуска {rtol:.1%}")
+                failed = True
+        if not np.isclose(thresholds[j], expected_thresholds[k], rtol=rtol, equal_nan=True):
+            print(f"{feature}: порог {thresholds[j]:g}, по всем дням {expected_thresholds[k]:g}")
+            failed = True
+    print("Хранилище совпадает с расчетом по всем дням" if not failed else "Есть расхождения больше ошибки скетчей")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
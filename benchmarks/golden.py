@@ -0,0 +1,133 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.reference import reference_score
+from benchmarks.synthetic import FILENAMES, make_export, write_export
+from frauds.engine import frame_matrix, score_frame
+from frauds.ingest import intermediate_path, preparse, read_export
+from frauds.pipelines import reweight, score_path
+from frauds.providers import PROVIDERS
+from frauds.streaming import score_streaming
+from frauds.tasks import matrix_path
+
+# Golden-проверка: рейтинги fraud_score_* всех режимов должны совпадать с
+# исходным кодом (benchmarks.reference) байт в байт после записи в CSV — те же
+# email, в том же порядке, с теми же значениями. Данные синтетические, с кольцами
+# и без, а также пустые и целиком отброшенные фильтрами провайдера. Завершается
+# с кодом 1 при любом расхождении
+#
+#   python -m benchmarks.golden
+#   python -m benchmarks.golden --rows 50000 --ring-rate 0.05 --chunksize 7000
+
+
+def _modes(spec, path, chunksize):
+    yield 'full', lambda: score_path(spec, path)
+    yield 'full (c)', lambda: score_frame(spec, read_export(spec, path, engine='c'))
+    yield 'streaming', lambda: score_streaming(path, spec, chunksize)
+
+    def from_intermediate():
+        preparse(spec, path)
+        try:
+            return score_path(spec, path)
+        finally:
+            os.remove(intermediate_path(path))
+    yield 'preparse', from_intermediate
+
+    def from_matrix():
+        # Сохраненная и заново загруженная (memmap) матрица признаков с весами провайдера
+        features_path = matrix_path(path)
+        frame_matrix(spec, read_export(spec, path)).save(features_path)
+        try:
+            return reweight(features_path)
+        finally:
+            os.remove(features_path)
+    yield 'reweight', from_matrix
+
+
+# Выгрузки, в которых не остается ни одной строки: значение колонки, при котором
+# фильтры провайдера отбрасывают все строки
+FILTERED_OUT = {
+    'unlimit': ('Card type', 'ewallet'),
+    'centrobill': ('Test', 'yes'),
+}
+
+
+# Значения, которые pandas по умолчанию читает как пропуск: pyarrow должен читать их так же
+NA_TOKENS = ('<NA>', 'NULL', 'N/A', 'nan', '#N/A')
+
+
+def write_edge_exports(provider, rows, directory, seed=0):
+    # Выгрузка с пропусками, записанными токенами NA_TOKENS, пустая выгрузка (только
+    # заголовок) и, если у провайдера есть фильтры, выгрузка, целиком отброшенная ими.
+    # Эталон на двух последних возвращает пустой рейтинг
+    sep = PROVIDERS[f"df_{provider}"].sep
+    df = make_export(provider, rows, seed=seed)
+    tokens = df.astype(object)
+    rng = np.random.default_rng(seed)
+    for col in tokens.columns:
+        missing = rng.random(len(tokens)) < 0.05
+        tokens.loc[missing, col] = rng.choice(NA_TOKENS, missing.sum())
+    path = os.path.join(directory, FILENAMES[provider].format('na_tokens'))
+    tokens.to_csv(path, sep=sep, index=False)
+    yield 'пропуски токенами', path
+    path = os.path.join(directory, FILENAMES[provider].format('empty'))
+    df.iloc[:0].to_csv(path, sep=sep, index=False)
+    yield 'пустая', path
+    if provider in FILTERED_OUT:
+        column, value = FILTERED_OUT[provider]
+        df[column] = value
+        path = os.path.join(directory, FILENAMES[provider].format('filtered'))
+        df.to_csv(path, sep=sep, index=False)
+        yield 'все строки отфильтрованы', path
+
+
+def check(provider, path, chunksize):
+    spec = PROVIDERS[f"df_{provider}"]
+    expected = reference_score(path).to_csv(index=False)
+    failed = 0
+    for mode, score in _modes(spec, path, chunksize):
+        actual = score().to_csv(index=False)
+        if actual == expected:
+            print(f"  {mode:10} ok")
+            continue
+        failed += 1
+        line = next((i for i, (a, b) in enumerate(zip(actual.splitlines(), expected.splitlines())) if a != b),
+                    min(actual.count('\n'), expected.count('\n')))
+        print(f"  {mode:10} РАСХОЖДЕНИЕ, первая отличающаяся строка CSV: {line + 1}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение всех режимов скоринга с исходным кодом")
+    parser.add_argument('--providers', nargs='+', default=['upgate', 'unlimit', 'payabl', 'centrobill'])
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--ring-rate', type=float, nargs='+', default=[0.0, 0.02])
+    parser.add_argument('--seed', type=int, default=0)
+    # Маленькие куски, чтобы ключи гарантированно встречались в нескольких кусках
+    parser.add_argument('--chunksize', type=int, default=3_000)
+    args = parser.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for provider in args.providers:
+            for ring_rate in args.ring_rate:
+                path = write_export(provider, args.rows, directory, seed=args.seed,
+                                    tag=f"{args.rows}_r{ring_rate}", ring_rate=ring_rate)
+                print(f"{provider}, {args.rows} строк, кольца {ring_rate:.0%}")
+                failed += check(provider, path, args.chunksize)
+            for label, path in write_edge_exports(provider, args.rows, directory, seed=args.seed):
+                print(f"{provider}, {label}")
+                failed += check(provider, path, args.chunksize)
+
+    if failed:
+        print(f"Расхождений с эталоном: {failed}")
+        sys.exit(1)
+    print("Все режимы совпадают с эталоном")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import FILENAMES, write_export
+from frauds import metrics
+from frauds.pipelines import score_path
+from frauds.providers import PROVIDERS
+from frauds.streaming import DEFAULT_CHUNKSIZE, score_streaming
+
+# Бенчмарк пайплайнов провайдеров на синтетических выгрузках: время, пиковая
+# память (RSS) и время по этапам. Каждый замер — в отдельном процессе.
+# Сгенерированные файлы кладутся в --data и переиспользуются между запусками
+#
+#   python -m benchmarks.run --rows 10000 1000000 10000000 --ring-rate 0.01
+#   python -m benchmarks.run --providers payabl --rows 1000000 --modes streaming
+
+
+def measure(mode, provider, path, chunksize):
+    spec = PROVIDERS[f"df_{provider}"]
+    with tempfile.TemporaryDirectory() as directory:
+        out_path = os.path.join(directory, 'result.csv')
+        # Этапы замеряет сам пайплайн (frauds.metrics), как в боте
+        metrics.start()
+        started = time.perf_counter()
+        if mode == 'full':
+            result = score_path(spec, path)
+        else:
+            result = score_streaming(path, spec, chunksize)
+        with metrics.stage('write', len(result)):
+            result.to_csv(out_path, index=False)
+        wall = time.perf_counter() - started
+    return {
+        'wall': wall,
+        'peak_rss_mb': metrics.peak_rss_mb(),
+        'stages': {name: values['seconds'] for name, values in metrics.take().items()},
+        'emails': len(result),
+    }
+
+
+def _run_child(mode, provider, path, chunksize):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.run', '--measure', mode, '--providers', provider,
+         '--chunksize', str(chunksize), path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def _data_path(args, provider, rows):
+    # Имя файла описывает параметры генерации, поэтому файлы можно переиспользовать
+    tag = f"{rows}_e{args.emails or 0}_c{args.cards or 0}_i{args.ips or 0}_r{args.ring_rate}_s{args.seed}"
+    directory = os.path.join(args.data, provider)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, FILENAMES[provider].format(tag))
+    if not os.path.exists(path):
+        write_export(provider, rows, directory, emails=args.emails, seed=args.seed, tag=tag,
+                     cards=args.cards, ips=args.ips, ring_rate=args.ring_rate)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пайплайнов провайдеров")
+    parser.add_argument('--providers', nargs='+', default=['upgate', 'unlimit', 'payabl', 'centrobill'])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument('--emails', type=int, default=None, help="число разных email (по умолчанию строки / 5)")
+    parser.add_argument('--cards', type=int, default=None)
+    parser.add_argument('--ips', type=int, default=None)
+    parser.add_argument('--ring-rate', type=float, default=0.0, help="доля строк мошеннических колец")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', nargs='+', default=['full', 'streaming'], choices=['full', 'streaming'])
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'frauds-bench'))
+    parser.add_argument('--measure', choices=['full', 'streaming'], help=argparse.SUPPRESS)
+    parser.add_argument('path', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.providers[0], args.path, args.chunksize)))
+        return
+
+    for provider in args.providers:
+        for rows in args.rows:
+            path = _data_path(args, provider, rows)
+            print(f"\n{provider}, {rows} строк, файл {os.path.getsize(path) / 2 ** 20:.0f} МБ")
+            for mode in args.modes:
+                stats = _run_child(mode, provider, path, args.chunksize)
+                stages = '  '.join(f"{name} {seconds:.2f}" for name, seconds in stats['stages'].items())
+                print(f"  {mode:10} {stats['wall']:8.2f} с  {stats['peak_rss_mb']:7.0f} МБ  "
+                      f"email {stats['emails']:>8}   {stages}")
+
+
+if __name__ == '__main__':
+    main()
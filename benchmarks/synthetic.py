@@ -0,0 +1,193 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from frauds.providers import PROVIDERS
+
+# Синтетические выгрузки провайдеров с теми колонками, которые читает движок.
+# Карты «привязаны» к email, поэтому распределения признаков похожи на реальные.
+# Число email, карт и IP настраивается; ring_rate — доля строк мошеннических
+# колец: ~8 email (ringN.M@mail.com) на 3 общие карты, один IP и два имени,
+# часть операций — чарджбэки
+
+FILENAMES = {
+    'upgate': 'transactions_{}.csv',
+    'unlimit': '20240101_120000_{}.csv',
+    'payabl': 'report_{}.csv',
+    'centrobill': 'export_{}.csv',
+}
+
+
+def _pick(rng, pool, n, missing=0.0):
+    out = np.asarray(pool, dtype=object)[rng.integers(0, len(pool), n)]
+    if missing:
+        out[rng.random(n) < missing] = np.nan
+    return out
+
+
+def _extra_columns(rng, n, count):
+    # Колонки, которые движок не читает: в реальных выгрузках их 60–120
+    words = [f"value_{i}" for i in range(1000)]
+    return {f"extra_{i}": rng.random(n) if i % 2 else _pick(rng, words, n) for i in range(count)}
+
+
+# Колонки, которые переписываются в строках колец: формат номера карты и чарджбэк
+RING_COLUMNS = {
+    'upgate': {'card_number': None, 'fraud': ('transactionType', 'FRAUD_ALERT')},
+    'unlimit': {'card_number': ('Card number', '{}******{:04d}'), 'fraud': ('Status', 'Chargeback')},
+    'payabl': {'card_number': ('Credit Card Number', '{}XXXXXX{:04d}'), 'fraud': ('Tx-Type', 'Chargeback')},
+    'centrobill': {'card_number': None, 'fraud': ('Type', 'Chargeback')},
+}
+RING_SIZE = 8
+
+
+def make_export(provider, rows, emails=None, seed=0, part=0, extra_columns=0, cards=None, ips=None,
+                ring_rate=0.0):
+    # Справочники (email, карты, IP) зависят только от seed и emails, строки — еще
+    # и от part: так большой файл можно собрать из нескольких частей
+    pool_rng = np.random.default_rng(seed)
+    rng = np.random.default_rng([seed, part])
+    n = rows
+    n_emails = emails or max(n // 5, 3)
+    n_cards = cards or max(n_emails // 3, 3)
+    n_ips = ips or max(n_emails // 2, 2)
+
+    email_pool = np.array([f"user{i}@mail.com" for i in range(n_emails)], dtype=object)
+    ip_pool = np.array([f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(n_ips)], dtype=object)
+    name_pool = np.array([f"NAME {i}" for i in range(n_ips)], dtype=object)
+    bins = pool_rng.integers(400000, 400000 + max(n_emails // 10, 3), n_cards)
+    last_four = pool_rng.integers(0, 10000, n_cards)
+    countries = ['DE', 'FR', 'US', 'GB', 'PL']
+    df = _make_rows(provider, rng, n, email_pool, ip_pool, name_pool, bins, last_four, countries)
+    if ring_rate:
+        _inject_rings(provider, df, rng, ring_rate, max(1, round(n_emails * ring_rate / RING_SIZE)))
+    if extra_columns:
+        df = pd.concat([df, pd.DataFrame(_extra_columns(rng, n, extra_columns))], axis=1)
+    return df
+
+
+def _make_rows(provider, rng, n, email_pool, ip_pool, name_pool, bins, last_four, countries):
+    n_emails, n_cards = len(email_pool), len(bins)
+
+    email_idx = rng.integers(0, n_emails, n)
+    card = np.where(rng.random(n) < 0.8, email_idx % n_cards, rng.integers(0, n_cards, n))
+    email = email_pool[email_idx].copy()
+    email[rng.random(n) < 0.02] = np.nan
+    amount = np.round(rng.lognormal(3, 1, n), 2)
+    operation = rng.integers(0, n, n)
+
+    if provider == 'upgate':
+        card_bin = bins[card].astype(float)
+        card_bin[rng.random(n) < 0.03] = np.nan
+        start = pd.Timestamp('2024-01-01', tz='UTC')
+        return pd.DataFrame({
+            'id': np.where(rng.random(n) < 0.01, np.nan, np.arange(n)),
+            'createdAt': start + pd.to_timedelta(rng.integers(0, 86400 * 30, n), unit='s'),
+            'payment.createdAt': start + pd.to_timedelta(rng.integers(0, 86400 * 30, n), unit='s'),
+            'payment.email': email,
+            'operationId': operation,
+            'payment.countryCode': _pick(rng, countries, n, 0.05),
+            'paymentContext.IP_COUNTRY_CODE': _pick(rng, countries, n, 0.05),
+            'paymentDetails.CARD_BIN': card_bin,
+            'paymentDetails.CARD_LAST_FOUR_DIGITS': last_four[card],
+            'paymentContext.BROWSER_USER_AGENT': _pick(rng, [f"UA{i}" for i in range(20)], n, 0.02),
+            'transactionDetails.THREE_DS_STATUS': _pick(rng, ['Y', 'Y', 'Y', 'N', 'R', 'U', 'A'], n, 0.1),
+            'paymentContext.IP': _pick(rng, ip_pool, n, 0.02),
+            'cardData.cardFullName': _pick(rng, name_pool, n, 0.03),
+            'payment.amount': amount,
+            'transactionType': _pick(rng, ['SALE'] * 8 + ['FRAUD_ALERT', 'CHARGEBACK', 'REFUND'], n),
+            'responseCodeStatus': _pick(rng, ['SUCCESS', 'SUCCESS', 'DECLINE'], n),
+        })
+    if provider == 'unlimit':
+        card_number = np.array([f"{b}******{x:04d}" for b, x in zip(bins[card], last_four[card])], dtype=object)
+        card_number[rng.random(n) < 0.02] = np.nan
+        return pd.DataFrame({
+            'Payment ID': operation,
+            'Email': email,
+            'Card type': _pick(rng, ['visa', 'mastercard', 'ewallet'], n, 0.02),
+            'IP country': _pick(rng, countries, n, 0.05),
+            'Card country': _pick(rng, countries, n, 0.05),
+            'Card number': card_number,
+            'Customer IP': _pick(rng, ip_pool, n, 0.02),
+            'Card Holder': _pick(rng, name_pool, n, 0.03),
+            'Amount': amount,
+            'Order type': _pick(rng, ['Payment'] * 5 + ['Refund'], n),
+            'Status': _pick(rng, ['Captured', 'Captured', 'Declined', 'Chargeback'], n),
+        })
+    if provider == 'payabl':
+        card_number = np.array([f"{b}XXXXXX{x:04d}" for b, x in zip(bins[card], last_four[card])], dtype=object)
+        return pd.DataFrame({
+            'Order No.': operation,
+            'EMail': email,
+            'Bin Country': _pick(rng, countries, n, 0.05),
+            'IP Country': _pick(rng, countries, n, 0.05),
+            'Credit Card Number': card_number,
+            'Credit Card Bin': bins[card],
+            'Customer-IP': _pick(rng, ip_pool, n, 0.02),
+            'Credit Cardholder': _pick(rng, name_pool, n, 0.03),
+            'Amount': amount,
+            'Tx-Type': _pick(rng, ['Authorisation'] * 6 + ['Chargeback', 'Capture'], n),
+            'Status': _pick(rng, ['Successful', 'Successful', 'Failed'], n),
+        })
+    if provider == 'centrobill':
+        card_bin = bins[card].astype(float)
+        card_bin[rng.random(n) < 0.03] = np.nan
+        return pd.DataFrame({
+            'Transaction ID': operation,
+            'E-mail': email,
+            'Payment method': _pick(rng, ['visa', 'mastercard', 'paypal'], n),
+            'Test': _pick(rng, ['no'] * 9 + ['yes'], n),
+            'Bin': card_bin,
+            'Last four': last_four[card],
+            'Customer name': _pick(rng, name_pool, n, 0.03),
+            'USD Cost': amount,
+            'Type': _pick(rng, ['Initial', 'Non-Recurring', 'Recurring', 'Chargeback', 'Refund'], n),
+            'Status': _pick(rng, ['success', 'success', 'fail'], n),
+        })
+    raise ValueError(f"неизвестный провайдер '{provider}'")
+
+
+def _inject_rings(provider, df, rng, ring_rate, n_rings):
+    rows = np.flatnonzero(rng.random(len(df)) < ring_rate)
+    ring = rng.integers(0, n_rings, len(rows))
+    member = rng.integers(0, RING_SIZE, len(rows))
+    card_bin = 520000 + ring % 1000
+    last_four = (ring * 3 + rng.integers(0, 3, len(rows))) % 10000
+
+    spec = PROVIDERS[f"df_{provider}"]
+    values = {
+        'email': [f"ring{r}.{m}@mail.com" for r, m in zip(ring, member)],
+        'ip': [f"172.16.{r // 256 % 256}.{r % 256}" for r in ring],
+        'name': [f"RING {r} {m % 2}" for r, m in zip(ring, member)],
+        'card_bin': card_bin,
+        'card_last_four': last_four,
+    }
+    for canonical, column in spec.columns.items():
+        if canonical in values and isinstance(column, str):
+            df.loc[rows, column] = values[canonical]
+    card_number = RING_COLUMNS[provider]['card_number']
+    if card_number is not None:
+        column, template = card_number
+        df.loc[rows, column] = [template.format(b, x) for b, x in zip(card_bin, last_four)]
+    column, value = RING_COLUMNS[provider]['fraud']
+    fraud = rows[rng.random(len(rows)) < 0.3]
+    df.loc[fraud, column] = value
+    time = spec.columns.get('time')
+    if time is not None:
+        # Операции кольца идут всплеском: в пределах 10 минут от начала кольца
+        ring_start = pd.Timestamp('2024-01-01', tz='UTC') + pd.to_timedelta(ring * 7919 % (86400 * 30), unit='s')
+        df.loc[rows, time] = ring_start + pd.to_timedelta(rng.integers(0, 600, len(rows)), unit='s')
+
+
+def write_export(provider, rows, directory, emails=None, seed=0, tag=None, extra_columns=0,
+                 part_rows=1_000_000, cards=None, ips=None, ring_rate=0.0):
+    # Пишется частями по part_rows строк, чтобы не держать в памяти 10М строк разом
+    emails = emails or max(rows // 5, 3)
+    path = os.path.join(directory, FILENAMES[provider].format(tag or rows))
+    sep = PROVIDERS[f"df_{provider}"].sep
+    for part, start in enumerate(range(0, rows, part_rows)):
+        df = make_export(provider, min(part_rows, rows - start), emails=emails, seed=seed, part=part,
+                         extra_columns=extra_columns, cards=cards, ips=ips, ring_rate=ring_rate)
+        df.to_csv(path, sep=sep, index=False, mode='w' if part == 0 else 'a', header=part == 0)
+    return path
@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import os
+import struct
+import zipfile
+
+# Сжатые выгрузки: .csv.gz, .zst и .zip с одним или несколькими CSV. Файл не
+# распаковывается на диск — парсер читает поток, который распаковывается на лету.
+# CSV внутри zip адресуется путем вида 'temp/1/export.zip::report_01.csv', дальше
+# такой путь ходит по пайплайну как обычный
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MEMBER_SEP = '::'
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+
+def is_supported(filename):
+    name = filename.lower()
+    if name.endswith('.zst') and zstandard is None:
+        return False
+    return name.endswith(('.csv', '.zip') + COMPRESSED_SUFFIXES)
+
+
+def split_member(path):
+    # 'archive.zip::member.csv' -> ('archive.zip', 'member.csv'), иначе (path, None)
+    if MEMBER_SEP in path:
+        archive, member = path.split(MEMBER_SEP, 1)
+        return archive, member
+    return path, None
+
+
+def _is_export_member(name):
+    # Служебные файлы архиватора macOS (__MACOSX/ и '._имя.csv') — не выгрузки
+    parts = name.split('/')
+    return name.lower().endswith('.csv') and '__MACOSX' not in parts and not parts[-1].startswith('._')
+
+
+def list_exports(path):
+    # Пути CSV, которые есть в загруженном файле: для zip — по одному на CSV внутри
+    if not path.lower().endswith('.zip'):
+        return [path]
+    with zipfile.ZipFile(path) as archive:
+        return [f"{path}{MEMBER_SEP}{info.filename}" for info in archive.infolist()
+                if not info.is_dir() and _is_export_member(info.filename)]
+
+
+def export_name(path):
+    # Имя CSV для определения провайдера и имени результата
+    path, member = split_member(path)
+    name = os.path.basename(member or path)
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def result_name(path):
+    # Имя CSV для файлов результата: export_name отбрасывает сжатие, архив и папки
+    # внутри zip, поэтому 'jan/report.csv' и 'feb/report.csv' из одного архива или
+    # report.csv рядом с report.csv.gz получили бы одно имя. Для сжатых файлов и
+    # CSV из zip к имени добавляется короткий хеш исходного имени
+    archive, member = split_member(path)
+    name = export_name(path)
+    if member is None and name == os.path.basename(archive):
+        return name
+    source = os.path.basename(archive) + (f"{MEMBER_SEP}{member}" if member is not None else '')
+    stem, ext = os.path.splitext(name)
+    return f"{stem}_{hashlib.sha1(source.encode()).hexdigest()[:8]}{ext}"
+
+
+def open_export(path):
+    # Бинарный поток с содержимым CSV (распаковывается по мере чтения)
+    path, member = split_member(path)
+    if member is not None:
+        archive = zipfile.ZipFile(path)
+        try:
+            stream = archive.open(member)
+        finally:
+            # Поток держит свою ссылку на файл архива
+            archive.close()
+        return stream
+    name = path.lower()
+    if name.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if name.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("для .zst нужен пакет zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def export_size(path):
+    # Размер CSV без сжатия (для выбора потокового режима); если в заголовке
+    # его нет — размер сжатого файла
+    path, member = split_member(path)
+    if member is not None:
+        with zipfile.ZipFile(path) as archive:
+            return archive.getinfo(member).file_size
+    name = path.lower()
+    if name.endswith('.gz'):
+        # Последние 4 байта gzip — размер исходных данных по модулю 4 ГБ
+        with open(path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return max(struct.unpack('<I', f.read(4))[0], os.path.getsize(path))
+    if name.endswith('.zst') and zstandard is not None:
+        with open(path, 'rb') as f:
+            size = zstandard.get_frame_parameters(f.read(18)).content_size
+        if size != zstandard.CONTENTSIZE_UNKNOWN:
+            return size
+    return os.path.getsize(path)
+
+
+def export_stamp(path):
+    # Размер и mtime загруженного файла (для CSV из zip — архива): меняются при
+    # повторной загрузке файла с тем же именем
+    stat = os.stat(split_member(path)[0])
+    return f"{stat.st_size}_{stat.st_mtime_ns}"
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from frauds.archives import open_export
+
+# Кэш расчетов по содержимому файла: одну и ту же выгрузку часто загружают
+# несколько раз за день. Ключ — sha256 от байтов файла, описания провайдера
+# (колонки, фильтры, веса) и CACHE_VERSION. Кэшируется матрица признаков
+# (frauds.matrix), рейтинг по ней пересчитывает frauds.pipelines.score_export.
+# Файлы лежат в одной папке, при превышении max_bytes удаляются давно не
+# использованные (LRU по mtime)
+
+# Увеличить, если меняется сам расчет, а не описание провайдеров
+CACHE_VERSION = 1
+
+_BLOCK_SIZE = 1024 * 1024
+
+
+def spec_fingerprint(spec):
+    # repr frozen-датакласса включает все поля, в том числе веса
+    return hashlib.sha256(repr(spec).encode()).hexdigest()
+
+
+def file_key(path, spec, mode=''):
+    # mode — параметры расчета, меняющие результат (например, приближенный режим)
+    digest = hashlib.sha256(f"{CACHE_VERSION}:{spec_fingerprint(spec)}:{mode}:".encode())
+    # По распакованному содержимому: тот же CSV в gz или zip — то же попадание
+    with open_export(path) as f:
+        for block in iter(lambda: f.read(_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Простой объект (папка + лимит): передается в процессы-воркеры, несколько
+    # воркеров могут писать в одну папку одновременно
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key, result_path):
+        # Расширение — по result_path: файлы разного вида под одним ключом не смешиваются
+        return os.path.join(self.directory, key + os.path.splitext(result_path)[1])
+
+    def get(self, key, result_path):
+        # Копирует результат из кэша в result_path; False, если его там нет
+        cached = self._path(key, result_path)
+        try:
+            shutil.copyfile(cached, result_path)
+        except FileNotFoundError:
+            return False
+        # Отметка использования для LRU
+        try:
+            os.utime(cached)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def put(self, key, result_path):
+        if os.path.getsize(result_path) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Сначала во временный файл той же папки, потом атомарный replace:
+        # параллельный get не увидит недописанный результат
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(result_path, tmp_path)
+            os.replace(tmp_path, self._path(key, result_path))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.tmp'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
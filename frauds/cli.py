@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import time
+
+from frauds.archives import export_name
+from frauds.cache import ResultCache
+from frauds.pipelines import find_exports, link_results, score_files
+from frauds.rings import MAX_ENTITY_EMAILS, MIN_RING_EMAILS
+from frauds.store import FeatureStore
+from frauds.streaming import DEFAULT_CHUNKSIZE
+
+# Скоринг без бота, например ночная сверка по архиву выгрузок:
+#
+#   python -m frauds score exports/ --jobs 8 --out results/
+#
+# Провайдер определяется по имени файла так же, как в боте; файлы считаются
+# параллельно в пуле процессов, результаты пишутся в --out. С --rings после
+# расчета ищутся кольца, общие для всех файлов (frauds.rings), — отчет rings.csv
+
+
+def score_command(args):
+    exports = find_exports(args.paths)
+    if not exports:
+        print("Нет CSV-файлов для обработки.", file=sys.stderr)
+        return 1
+
+    cache = ResultCache(args.cache_dir, args.cache_mb * 1024 * 1024) if args.cache_dir else None
+    store = FeatureStore(args.store, args.window_days) if args.store else None
+    started = time.perf_counter()
+    failed = 0
+    results = []
+    for path, result, error in score_files(exports, args.out, jobs=args.jobs,
+                                           streaming_threshold_mb=args.streaming_threshold_mb,
+                                           chunk_rows=args.chunk_rows, cache=cache, store=store,
+                                           distinct_error=args.approx_error):
+        if error is None:
+            result_path, cached = result
+            results.append((path, result_path))
+            print(f"✅ {path} -> {result_path}{' (из кэша)' if cached else ''}")
+        else:
+            failed += 1
+            print(f"⚠️ Ошибка в файле '{export_name(path)}': {error}", file=sys.stderr)
+
+    print(f"Обработано {len(exports) - failed} из {len(exports)} файлов за {time.perf_counter() - started:.1f} с")
+    if args.rings and results:
+        started = time.perf_counter()
+        rings_path, count, cross = link_results(
+            results, os.path.join(args.out, 'rings.csv'), args.ring_min_emails, args.ring_max_entity_emails,
+            args.streaming_threshold_mb, args.chunk_rows, args.jobs,
+        )
+        print(f"🔗 Колец: {count}, из них в нескольких провайдерах: {cross} -> {rings_path} "
+              f"за {time.perf_counter() - started:.1f} с")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m frauds', description="Скоринг выгрузок провайдеров")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    score = commands.add_parser('score', help="посчитать файлы и папки с выгрузками")
+    score.add_argument('paths', nargs='+', help="CSV (.csv, .csv.gz, .zst, .zip) или папки с ними")
+    score.add_argument('--out', required=True, help="папка для результатов")
+    score.add_argument('--jobs', type=int, default=os.cpu_count(), help="число процессов")
+    score.add_argument('--streaming-threshold-mb', type=int, default=200,
+                       help="файлы больше этого размера считаются потоково")
+    score.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNKSIZE)
+    score.add_argument('--cache-dir', default=None, help="кэш результатов по содержимому файла")
+    score.add_argument('--cache-mb', type=int, default=1024)
+    score.add_argument('--store', default=None,
+                       help="SQLite-хранилище признаков: считать вместе с историей (лучше с --jobs 1, "
+                            "чтобы история пополнялась в порядке файлов)")
+    score.add_argument('--window-days', type=int, default=30)
+    score.add_argument('--approx-error', type=float, default=None,
+                       help="приближенный подсчет уникальных значений с этой относительной ошибкой "
+                            "для файлов, которые считаются потоково")
+    score.add_argument('--rings', action='store_true',
+                       help="искать кольца по общим картам, IP и именам во всех файлах")
+    score.add_argument('--ring-min-emails', type=int, default=MIN_RING_EMAILS)
+    score.add_argument('--ring-max-entity-emails', type=int, default=MAX_ENTITY_EMAILS,
+                       help="сущность большего числа email (общий IP, частое имя) не связывает их")
+    score.set_defaults(handler=score_command)
+
+    args = parser.parse_args(argv)
+    sys.exit(args.handler(args))
@@ -0,0 +1,54 @@
+import gzip
+import importlib.util
+import io
+
+# Отправка результатов без промежуточных файлов: результат сериализуется в
+# память в выбранном формате и уходит в Telegram как байты.
+#   csv      — как есть
+#   gz       — CSV в gzip: в разы меньше, Excel/pandas открывают после распаковки
+#   parquet  — колоночный формат для pandas/Spark (нужен pyarrow)
+#   top      — первые строки рейтинга текстом прямо в сообщении
+# Документ готовится в процессе-воркере из кадра результата (score_job,
+# reweight_document, rings_document), бот получает уже готовые байты
+
+FORMATS = ('csv', 'gz', 'parquet', 'top')
+EXTENSIONS = {'csv': '.csv', 'gz': '.csv.gz', 'parquet': '.parquet'}
+# Длина сообщения в Telegram
+MESSAGE_LIMIT = 4096
+
+
+def available_formats():
+    if importlib.util.find_spec('pyarrow') is None:
+        return tuple(fmt for fmt in FORMATS if fmt != 'parquet')
+    return FORMATS
+
+
+def _gzip(data):
+    # mtime=0: одинаковый результат дает одинаковые байты
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _top_text(header, rows, total, limit=MESSAGE_LIMIT):
+    # Строки, которые не влезают в одно сообщение, отбрасываются
+    columns = ' · '.join(header)
+    lines, length = [], len(columns) + 40
+    for number, row in enumerate(rows, 1):
+        line = f"{number}. {' · '.join(row)}"
+        if length + len(line) + 1 > limit:
+            break
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join([f"Первые {len(lines)} из {total}: {columns}"] + lines)
+
+
+def render_frame(df, name, fmt, top=20):
+    # -> (имя файла, байты) или (None, текст сообщения) для fmt='top'
+    if fmt == 'top':
+        rows = [[str(value) for value in row] for row in df.head(top).itertuples(index=False)]
+        return None, _top_text([str(col) for col in df.columns], rows, len(df))
+    if fmt == 'parquet':
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        return name + EXTENSIONS[fmt], buffer.getvalue()
+    data = df.to_csv(index=False).encode()
+    return name + EXTENSIONS[fmt], _gzip(data) if fmt == 'gz' else data
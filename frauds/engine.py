@@ -0,0 +1,270 @@
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from frauds.keys import encode, map_unique, pack
+from frauds.matrix import FeatureMatrix, distribution
+from frauds.metrics import stage
+from frauds.providers import TextSlice
+from frauds.velocity import VELOCITY_FEATURES, window_counts
+
+# Общий движок признаков: выгрузка любого провайдера сначала приводится
+# к каноническим колонкам (prepare), дальше все признаки и скоринг одинаковые
+
+# Признак -> (ключ группировки, колонка, по которой считаются уникальные значения,
+#             значение для строк без ключа: None — строка не участвует в перцентиле)
+DISTINCT_FEATURES = {
+    'email_operation_count': (['email'], 'operation', None),
+    'different_cards_per_email': (['email'], 'card_last_four', None),
+    'ua_variety': (['email'], 'ua', None),
+    'unique_bins_per_email': (['email'], 'bin_value', 0),
+    'unique_card_names_per_email': (['email'], 'name', 0),
+    'card_used_by_different_emails': (['card_bin', 'card_last_four'], 'email', None),
+    'multiacc': (['ip'], 'email', None),
+    'unique_emails_per_card_name': (['name'], 'email', 0),
+}
+
+# Признак -> флаги строк, которые суммируются по email (строки без email получают 0)
+COUNTER_FEATURES = {
+    'failed_3ds_per_email': ['is_3ds_fail'],
+    'fraud_transactions_count': ['is_fraud'],
+    'failure_ratio': ['is_decline', 'is_success'],
+}
+
+# Признаки строки: флаг берется из первой строки email без порога по перцентилю
+ROW_FEATURES = {
+    'geo_mismatch': ['geo_mismatch'],
+    'large_payment': ['amount'],
+}
+
+
+def _all_rules(df, rules):
+    return reduce(lambda left, right: left & right, (rule.mask(df) for rule in rules))
+
+
+def _mismatch(first, second, missing_is_mismatch):
+    # Сравнение по кодам общего словаря: category-колонки с разными
+    # категориями напрямую не сравниваются
+    categories = pd.Index(first.dropna().unique()).union(pd.Index(second.dropna().unique()))
+    first = pd.Categorical(first, categories=categories).codes
+    second = pd.Categorical(second, categories=categories).codes
+    missing = (first < 0) | (second < 0)
+    if missing_is_mismatch:
+        return (first != second) | missing
+    return ~missing & (first != second)
+
+
+def prepare(spec, df):
+    # Фильтры провайдера и переход к каноническим колонкам. Колонки,
+    # которых нет в выгрузке, пропускаются — зависящие от них признаки не считаются
+    if spec.filters:
+        df = df[_all_rules(df, spec.filters)]
+
+    frame = pd.DataFrame(index=df.index)
+    for canonical, source in spec.columns.items():
+        if isinstance(source, TextSlice):
+            if source.column in df:
+                # Срез считается по уникальным номерам карт, а не по каждой строке
+                frame[canonical] = map_unique(df[source.column], source.extract)
+        elif source in df:
+            frame[canonical] = df[source]
+
+    if 'card_bin' in frame:
+        frame['bin_value'] = _bin_values(spec, frame['card_bin'])
+
+    if spec.countries and all(col in df for col in spec.countries):
+        frame['geo_mismatch'] = _mismatch(*(df[col] for col in spec.countries), spec.geo_missing_is_mismatch)
+
+    for flag, rules in (('is_success', spec.success), ('is_decline', spec.decline),
+                        ('is_fraud', spec.fraud), ('is_3ds_fail', spec.failed_3ds)):
+        if rules and all(rule.column in df for rule in rules):
+            frame[flag] = _all_rules(df, rules)
+    return frame
+
+
+def _bin_values(spec, bins):
+    # BIN для unique_bins_per_email: как astype(str) и срез по каждой строке,
+    # только по уникальным значениям (пропуск как текст — 'nan')
+    if spec.bins_as_text:
+        return map_unique(bins, lambda uniques: uniques.astype(str).str[:spec.bin_prefix], missing='nan')
+    if spec.bin_prefix:
+        return map_unique(bins, lambda uniques: uniques.str[:spec.bin_prefix])
+    return bins
+
+
+def _required_columns(feature):
+    if feature in DISTINCT_FEATURES:
+        keys, value, _ = DISTINCT_FEATURES[feature]
+        return keys + [value]
+    if feature in VELOCITY_FEATURES:
+        keys, _ = VELOCITY_FEATURES[feature]
+        return keys + ['time']
+    if feature in COUNTER_FEATURES:
+        return ['email'] + COUNTER_FEATURES[feature]
+    return ROW_FEATURES[feature]
+
+
+def active_features(spec, frame):
+    # Признаки из весов провайдера, для которых в выгрузке есть все колонки
+    features = []
+    for col in spec.weights:
+        feature = col[len('is_fraud_'):]
+        if all(required in frame for required in _required_columns(feature)):
+            features.append(feature)
+    return features
+
+
+class _KeyCodes:
+    # Целочисленные коды колонок кадра (frauds.keys): каждая колонка кодируется
+    # один раз и переиспользуется всеми признаками (пропуск -> -1)
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._codes = {}
+        self._uniques = {}
+
+    def uniques(self, column):
+        self[[column]]
+        return self._uniques[column]
+
+    def __getitem__(self, keys):
+        keys = tuple(keys)
+        if keys not in self._codes:
+            if len(keys) == 1:
+                codes, uniques = encode(self.frame[keys[0]])
+                self._codes[keys] = codes, len(uniques)
+                self._uniques[keys[0]] = uniques
+            else:
+                # Составной ключ (BIN, последние 4): пара кодов -> один int64
+                (left, _), (right, n_right) = self[keys[:1]], self[keys[1:]]
+                self._codes[keys] = pack(left, right, n_right)
+        return self._codes[keys]
+
+
+def _distinct_per_key(key_codes, n_keys, value_codes, n_values):
+    # Число разных значений на ключ: уникальные пары (ключ, значение) без
+    # пропусков, затем bincount по ключу — без groupby по объектам
+    valid = (key_codes >= 0) & (value_codes >= 0)
+    pairs = pd.unique(key_codes[valid].astype(np.int64) * max(n_values, 1) + value_codes[valid])
+    return np.bincount(pairs // max(n_values, 1), minlength=n_keys).astype(float)
+
+
+def entity_features(frame, features, codes):
+    # Признак -> (значение на ключ, код ключа каждой строки, значение для строк
+    # без ключа). Признаки строки (ROW_FEATURES) сюда не входят
+    email_codes, n_emails = codes[['email']]
+    entities = {}
+    for feature in features:
+        if feature in DISTINCT_FEATURES:
+            keys, value, fill = DISTINCT_FEATURES[feature]
+            key_codes, n_keys = codes[keys]
+            per_key = _distinct_per_key(key_codes, n_keys, *codes[[value]])
+            entities[feature] = per_key, key_codes, np.nan if fill is None else fill
+
+    # Признаки скорости (frauds.velocity): одна сортировка на ключ для всех его окон
+    velocity = {}
+    for feature in features:
+        if feature in VELOCITY_FEATURES:
+            keys, seconds = VELOCITY_FEATURES[feature]
+            velocity.setdefault(tuple(keys), []).append((feature, seconds))
+    for keys, windows in velocity.items():
+        key_codes, n_keys = codes[keys]
+        counts = window_counts(key_codes, n_keys, frame['time'].to_numpy(dtype='datetime64[ns]'),
+                               {seconds for _, seconds in windows})
+        for feature, seconds in windows:
+            entities[feature] = counts[seconds], key_codes, np.nan
+
+    # Все счетчики по email за один проход bincount
+    counter_columns = sorted({col for feature in features if feature in COUNTER_FEATURES
+                              for col in COUNTER_FEATURES[feature]})
+    has_email = email_codes >= 0
+    counters = {col: np.bincount(email_codes[has_email], weights=frame[col].to_numpy()[has_email],
+                                 minlength=n_emails)
+                for col in counter_columns}
+    for feature in features:
+        if feature == 'failure_ratio':
+            # Отношение отказов к успешным: только для email, у которых есть успешные
+            per_email = np.zeros(n_emails)
+            np.divide(counters['is_decline'], counters['is_success'], out=per_email, where=counters['is_success'] > 0)
+        elif feature in COUNTER_FEATURES:
+            per_email = counters[COUNTER_FEATURES[feature][0]]
+        else:
+            continue
+        entities[feature] = per_email, email_codes, 0
+    return entities
+
+
+def feature_matrix(spec, frame, features, codes):
+    # Значения признаков по email (из первой строки email) и распределения по
+    # строкам для порогов: пороги считаются по значениям ключей с числом строк,
+    # без значения на каждую строку
+    email_codes, n_emails = codes[['email']]
+    present, first = np.unique(email_codes, return_index=True)
+    first = first[present >= 0]
+
+    entities = entity_features(frame, features, codes)
+    values = np.empty((n_emails, len(features)))
+    distributions = []
+    for j, feature in enumerate(features):
+        if feature == 'geo_mismatch':
+            values[:, j] = frame['geo_mismatch'].to_numpy(dtype=bool)[first]
+            distributions.append(None)
+        elif feature == 'large_payment':
+            amounts = frame['amount'].to_numpy(dtype=float)
+            values[:, j] = amounts[first]
+            amount_rows = pd.Series(amounts).value_counts()
+            distributions.append(distribution(amount_rows.index, amount_rows.to_numpy()))
+        else:
+            per_key, key_codes, fill = entities[feature]
+            with_fill = np.append(per_key, fill)
+            values[:, j] = with_fill[key_codes[first]]
+            # Строки на ключ; строки без ключа (код -1) — последним элементом
+            key_rows = np.bincount(key_codes + 1, minlength=len(with_fill))
+            distributions.append(distribution(with_fill, np.append(key_rows[1:], key_rows[0])))
+    return FeatureMatrix(spec.name, features, codes.uniques('email'), values, distributions)
+
+
+def weighted_scores(spec, features, flags, weights=None):
+    # flags — матрица email x признак. Сумма flags * вес идет по столбцам в порядке
+    # весов, поэтому score совпадает с прежним побитово (важно для порядка равных)
+    weights = spec.weights if weights is None else weights
+    vector = np.array([weights[f'is_fraud_{feature}'] for feature in features], dtype=float)
+    scores = np.zeros(len(flags))
+    for j, weight in enumerate(vector):
+        scores += flags[:, j] * weight
+    if spec.normalize_score:
+        scores /= sum(vector.tolist())
+    return scores
+
+
+def ranking(spec, emails, scores):
+    # Сортировка по fraud_score
+    result = pd.DataFrame({spec.email_column: emails, spec.score_column: scores})
+    return result.sort_values(by=spec.score_column, ascending=False).reset_index(drop=True)
+
+
+def score_matrix(spec, matrix, weights=None, percentile=0.95):
+    # Флаги по порогам матрицы и ранжирование. weights — новые веса поверх весов
+    # провайдера ('is_fraud_<признак>' -> вес), percentile — новый порог
+    if weights:
+        unknown = sorted(set(weights) - set(spec.weights))
+        if unknown:
+            raise ValueError(f"неизвестные признаки для {spec.name}: {', '.join(unknown)}")
+    weights = {**spec.weights, **(weights or {})}
+    scores = weighted_scores(spec, matrix.features, matrix.flags(percentile), weights)
+    return ranking(spec, matrix.emails, scores)
+
+
+def frame_matrix(spec, df):
+    with stage('prepare', len(df)):
+        frame = prepare(spec, df)
+    with stage('features', len(frame)):
+        features = active_features(spec, frame)
+        return feature_matrix(spec, frame, features, _KeyCodes(frame))
+
+
+def score_frame(spec, df):
+    matrix = frame_matrix(spec, df)
+    with stage('score'):
+        return score_matrix(spec, matrix)
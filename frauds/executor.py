@@ -0,0 +1,77 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _ready():
+    return os.getpid()
+
+
+def _start_workers(pool, count):
+    # В потоке: пока свободного воркера нет, submit запускает новый процесс и ждет,
+    # пока forkserver импортирует preload-модули (см. frauds.warmup)
+    futures = [pool.submit(_ready) for _ in range(count)]
+    return len({future.result() for future in futures})
+
+
+def _warm_up_done(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Не удалось запустить воркеры заранее: {task.exception()}")
+
+
+class ScoringExecutor:
+    # Пул процессов для тяжелых pandas-пайплайнов: event loop бота только
+    # ждет результат и продолжает отвечать остальным пользователям.
+    # shared_slots — asyncio.Semaphore, общий с другими процессами расчета
+    # (JobRunner): задача занимает место в нем, пока выполняется
+
+    def __init__(self, max_workers=None, max_pending=None, shared_slots=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Сколько задач одновременно может стоять в пуле (в работе и в очереди);
+        # остальные ждут на семафоре, не раздувая очередь пула
+        self.max_pending = max_pending or self.max_workers * 2
+        self.shared_slots = shared_slots
+        self._slots = None
+        self._pool = None
+        self._warming = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # forkserver: не форкаем процесс с работающим event loop и потоками
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return self._pool
+
+    def warm_up(self):
+        # Запускает все процессы пула в фоне сразу после старта бота, а не на
+        # первой задаче. Запуск процесса блокирует, поэтому он идет в потоке;
+        # задачи, пришедшие раньше, ждут его в run. Возвращает asyncio.Task
+        if self._warming is None:
+            self._warming = asyncio.ensure_future(asyncio.to_thread(_start_workers, self._get_pool(),
+                                                                    self.max_workers))
+            self._warming.add_done_callback(_warm_up_done)
+        return self._warming
+
+    async def run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if self._warming is not None and not self._warming.done():
+            await asyncio.wait([self._warming])
+        async with self._slots:
+            if self.shared_slots is None:
+                return await self._submit(fn, *args)
+            async with self.shared_slots:
+                return await self._submit(fn, *args)
+
+    async def _submit(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), fn, *args)
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+            self._warming = None
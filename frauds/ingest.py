@@ -0,0 +1,149 @@
+import os
+
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+from frauds.archives import export_stamp, open_export, split_member
+
+# Чтение выгрузок: только нужные движку колонки (ProviderSpec.usecols), заранее
+# заданные типы (статусы и страны — category) и CSV-движок pyarrow, если он
+# установлен. Без pyarrow используется обычный C-движок pandas.
+# Выгрузку можно разобрать заранее (preparse, сразу после загрузки в бот) в
+# колоночный промежуточный файл рядом с CSV: Parquet, а без pyarrow — pickle.
+# Сжатые файлы и CSV из zip читаются потоком через frauds.archives.open_export
+
+try:
+    import pyarrow
+    from pyarrow import csv as pyarrow_csv
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = 'c'
+
+
+def read_header(spec, path):
+    with open_export(path) as f:
+        return list(pd.read_csv(f, sep=spec.sep, nrows=0).columns)
+
+
+def read_options(spec, path, dtype=None, columns=None):
+    # usecols/dtype только по колонкам, которые есть в файле: отсутствующие
+    # колонки не ошибка, зависящие от них признаки просто не считаются.
+    # Текстовые ключи читаются словарем, если dtype не задает другое.
+    # columns — только эти колонки вместо всех нужных движку (см. frauds.rings)
+    header = set(read_header(spec, path))
+    usecols = [col for col in (spec.usecols if columns is None else columns) if col in header]
+    dtypes = {**dict.fromkeys(spec.key_columns, 'category'), **(spec.dtypes or {}), **(dtype or {})}
+    dtypes = {col: kind for col, kind in dtypes.items() if col in header}
+    return {'sep': spec.sep, 'usecols': usecols, 'dtype': dtypes}
+
+
+def _pyarrow_options(sep, usecols, dtype):
+    # Пропуски — те же значения, что и у C-движка pandas по умолчанию ('', 'NA',
+    # '<NA>', 'NULL', ...), category-колонки сразу читаются словарем и становятся
+    # Categorical, str и float — строками и числами
+    types = {'category': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+             str: pyarrow.string(), float: pyarrow.float64()}
+    column_types = {col: types[kind] for col, kind in dtype.items() if kind in types}
+    return {
+        'parse_options': pyarrow_csv.ParseOptions(delimiter=sep),
+        'convert_options': pyarrow_csv.ConvertOptions(
+            include_columns=usecols, column_types=column_types, null_values=sorted(STR_NA_VALUES),
+            strings_can_be_null=True,
+        ),
+    }
+
+
+def _read_pyarrow(path, sep, usecols, dtype):
+    # Напрямую через pyarrow.csv
+    with open_export(path) as f:
+        table = pyarrow_csv.read_csv(f, **_pyarrow_options(sep, usecols, dtype))
+    return table.to_pandas()
+
+
+def _read_chunks_pyarrow(path, chunksize, sep, usecols, dtype):
+    # Потоковый pyarrow.csv: блоки файла разбираются в несколько потоков и
+    # режутся на куски ровно по chunksize строк
+    with open_export(path) as f:
+        batches, rows = [], 0
+        for batch in pyarrow_csv.open_csv(f, **_pyarrow_options(sep, usecols, dtype)):
+            batches.append(batch)
+            rows += batch.num_rows
+            while rows >= chunksize:
+                table = pyarrow.Table.from_batches(batches)
+                yield table.slice(0, chunksize).to_pandas()
+                rest = table.slice(chunksize)
+                batches, rows = rest.to_batches(), rest.num_rows
+        if rows:
+            yield pyarrow.Table.from_batches(batches).to_pandas()
+
+
+def _convert_dates(spec, df):
+    for col in spec.dates:
+        if col in df:
+            df[col] = pd.to_datetime(df[col], errors='coerce', utc=True)
+    return df
+
+
+def read_export(spec, path, engine=None, columns=None):
+    options = read_options(spec, path, columns=columns)
+    if (engine or CSV_ENGINE) == 'pyarrow':
+        try:
+            return _convert_dates(spec, _read_pyarrow(path, **options))
+        except pyarrow.ArrowInvalid:
+            # Например, перевод строки внутри значения — такие файлы читает C-движок
+            pass
+    with open_export(path) as f:
+        return _convert_dates(spec, pd.read_csv(f, engine='c', **options))
+
+
+def intermediate_path(path, stamp=None):
+    # В имени — export_stamp той версии выгрузки, из которой файл разобран: разбор
+    # прежней загрузки с тем же именем, закончившийся позже новой, не подойдет к ней
+    stamp = stamp or export_stamp(path)
+    path, member = split_member(path)
+    if member is not None:
+        path = f"{path}.{member.replace('/', '_')}"
+    return f"{path}.{stamp}.parquet" if pyarrow is not None else f"{path}.{stamp}.pkl"
+
+
+def preparse(spec, path):
+    # Разбирает CSV и сохраняет готовый кадр рядом с ним; возвращает путь.
+    # Пишется во временный файл и переименовывается, чтобы load_export не
+    # прочитал недописанный. Версия выгрузки берется до чтения
+    stamp = export_stamp(path)
+    df = read_export(spec, path)
+    target = intermediate_path(path, stamp)
+    tmp_path = f"{target}.tmp"
+    if target.endswith('.parquet'):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, target)
+    return target
+
+
+def load_export(spec, path):
+    # Готовый промежуточный файл этой версии выгрузки, иначе обычное чтение
+    target = intermediate_path(path)
+    if not os.path.exists(target):
+        return read_export(spec, path)
+    if target.endswith('.parquet'):
+        return pd.read_parquet(target)
+    return pd.read_pickle(target)
+
+
+def read_chunks(spec, path, chunksize, dtype=None, columns=None):
+    options = read_options(spec, path, dtype, columns)
+    rows = 0
+    if CSV_ENGINE == 'pyarrow':
+        try:
+            for chunk in _read_chunks_pyarrow(path, chunksize, **options):
+                rows += len(chunk)
+                yield chunk
+            return
+        except pyarrow.ArrowInvalid:
+            # Как в read_export: файл дочитывает C-движок с первой невыданной строки
+            pass
+    with open_export(path) as f:
+        yield from pd.read_csv(f, chunksize=chunksize, skiprows=range(1, rows + 1), **options)
@@ -0,0 +1,58 @@
+import os
+import time
+
+# Уборка temp/: загруженные выгрузки, результаты, матрицы признаков и
+# промежуточные файлы никто не удалял, и диск долгоживущего контейнера только
+# заполнялся. sweep удаляет файлы старше max_age, а если папка все равно больше
+# max_bytes — самые старые (по mtime), пока не уложится. Не трогает файлы моложе
+# grace (их может дописывать воркер) и защищенные: выгрузки в очереди и в
+# незакрытом /batch вместе с файлами рядом с ними (разобранный Parquet и т.п.)
+
+
+def _files(directory):
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def sweep(directory, max_age=None, max_bytes=None, protected=(), grace=600, now=None):
+    # -> (удалено файлов, освобождено байт). max_age — в секундах, None — без
+    # ограничения; protected — пути, файлы с таким началом пути не удаляются
+    if not os.path.isdir(directory):
+        return 0, 0
+    now = time.time() if now is None else now
+    protected = tuple(os.path.abspath(path) for path in protected)
+    removed = freed = 0
+    kept = []
+    for mtime, size, path in _files(directory):
+        if now - mtime < grace or (protected and os.path.abspath(path).startswith(protected)):
+            continue
+        if max_age is not None and now - mtime > max_age:
+            if _remove(path):
+                removed, freed = removed + 1, freed + size
+        else:
+            kept.append((mtime, size, path))
+
+    if max_bytes is not None:
+        # Квота считается по всей папке, включая файлы, которые удалять нельзя
+        total = sum(size for _, size, _ in _files(directory))
+        for mtime, size, path in sorted(kept):
+            if total <= max_bytes:
+                break
+            if _remove(path):
+                removed, freed = removed + 1, freed + size
+            total -= size
+    return removed, freed
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import multiprocessing
+import sqlite3
+import time
+
+# Очередь задач бота в SQLite: /done ставит батч (файлы пользователя) в очередь,
+# JobRunner раздает файлы процессам-воркерам. Следующий файл берется у
+# пользователя, которого дольше всех не обслуживали (round-robin), поэтому 30
+# файлов одного аналитика не блокируют остальных. Одновременно считается не больше
+# limit файлов. Каждый файл — отдельный процесс, поэтому /cancel может его убить.
+# Очередь переживает перезапуск: задачи, которые считались в момент остановки,
+# снова ставятся в очередь
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, user_id);
+CREATE INDEX IF NOT EXISTS tasks_batch ON tasks (batch_id);
+"""
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobQueue:
+    # Работает в потоке event loop бота: запросы к локальной SQLite короткие
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def submit(self, user_id, chat_id, paths):
+        with self.connection:
+            batch_id = self.connection.execute(
+                "INSERT INTO batches (user_id, chat_id, created) VALUES (?, ?, ?)", (user_id, chat_id, time.time())
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO tasks (batch_id, user_id, path, status) VALUES (?, ?, ?, ?)",
+                [(batch_id, user_id, path, QUEUED) for path in paths],
+            )
+        return batch_id
+
+    def set_message(self, batch_id, message_id):
+        with self.connection:
+            self.connection.execute("UPDATE batches SET message_id = ? WHERE id = ?", (message_id, batch_id))
+
+    def batch(self, batch_id):
+        return self.connection.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+
+    def task(self, task_id):
+        return self.connection.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+
+    def progress(self, batch_id):
+        # Статус -> число файлов батча (плюс 'total')
+        counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED, CANCELLED), 0)
+        for status, count in self.connection.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE batch_id = ? GROUP BY status", (batch_id,)):
+            counts[status] = count
+        counts['total'] = sum(counts.values())
+        return counts
+
+    def next_task(self, last_served):
+        # Самая старая задача пользователя, которого дольше всех не обслуживали
+        users = [row[0] for row in self.connection.execute(
+            "SELECT DISTINCT user_id FROM tasks WHERE status = ?", (QUEUED,))]
+        if not users:
+            return None
+        user_id = min(users, key=lambda user: (last_served.get(user, 0), user))
+        return self.connection.execute(
+            "SELECT * FROM tasks WHERE status = ? AND user_id = ? ORDER BY id LIMIT 1", (QUEUED, user_id)
+        ).fetchone()
+
+    def start(self, task_id):
+        with self.connection:
+            self.connection.execute("UPDATE tasks SET status = ? WHERE id = ?", (RUNNING, task_id))
+
+    def finish(self, task_id, status, result=None, error=None):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = ? WHERE id = ?",
+                (status, None if result is None else json.dumps(result), error, task_id),
+            )
+
+    def active_paths(self):
+        # Файлы задач в очереди и в работе: их нельзя удалять из temp/
+        return [row[0] for row in self.connection.execute(
+            "SELECT path FROM tasks WHERE status IN (?, ?)", (QUEUED, RUNNING))]
+
+    def results(self, batch_id):
+        # [(path, result)] готовых файлов батча
+        return [(task['path'], json.loads(task['result'])) for task in self.connection.execute(
+            "SELECT * FROM tasks WHERE batch_id = ? AND status = ? ORDER BY id", (batch_id, DONE))]
+
+    def last_results(self, user_id):
+        # [(path, result)] готовых файлов последнего батча пользователя, где они есть
+        batch_id = self.connection.execute("SELECT MAX(batch_id) FROM tasks WHERE user_id = ? AND status = ?",
+                                           (user_id, DONE)).fetchone()[0]
+        if batch_id is None:
+            return []
+        return self.results(batch_id)
+
+    def cancel_user(self, user_id):
+        # Снимает с очереди задачи пользователя; возвращает затронутые батчи
+        # и число снятых задач
+        with self.connection:
+            batches = [row[0] for row in self.connection.execute(
+                "SELECT DISTINCT batch_id FROM tasks WHERE user_id = ? AND status IN (?, ?)",
+                (user_id, QUEUED, RUNNING))]
+            count = self.connection.execute("UPDATE tasks SET status = ? WHERE user_id = ? AND status = ?",
+                                            (CANCELLED, user_id, QUEUED)).rowcount
+        return batches, count
+
+    def recover(self):
+        # После перезапуска: прерванные задачи снова в очередь
+        with self.connection:
+            return self.connection.execute("UPDATE tasks SET status = ? WHERE status = ?",
+                                           (QUEUED, RUNNING)).rowcount
+
+    def close(self):
+        self.connection.close()
+
+
+def _run_child(conn, fn, args):
+    # Процесс-воркер: результат или текст ошибки уходит обратно через pipe
+    try:
+        message = (True, fn(*args))
+    except Exception as e:
+        message = (False, str(e))
+    conn.send(message)
+    conn.close()
+
+
+class JobRunner:
+    # on_update(batch_id, task, event, payload) вызывается при старте ('started') и
+    # завершении ('finished') файла и после /cancel для батчей без работающих файлов
+    # ('cancelled', task=None). job_args(task) -> аргументы fn для файла.
+    # fn возвращает (результат, payload): результат (JSON) сохраняется в очереди,
+    # payload (например, готовый документ) только передается в on_update при
+    # 'finished' и нигде не хранится; у остальных событий payload — None.
+    # slots — asyncio.Semaphore, общий с другими процессами расчета (ScoringExecutor):
+    # каждый файл занимает место в нем, пока работает его процесс
+
+    def __init__(self, queue, fn, job_args, limit, preload=(), slots=None):
+        self.queue = queue
+        self.fn = fn
+        self.job_args = job_args
+        self.limit = limit
+        self.slots = slots
+        self.context = multiprocessing.get_context("forkserver")
+        if preload:
+            # Модули, импортированные в forkserver заранее: воркер стартует без импорта
+            # pandas (в боте — frauds.warmup, который еще и прогревает пайплайны)
+            self.context.set_forkserver_preload(list(preload))
+        self.on_update = None
+        self.running = {}
+        self.cancelled = set()
+        self.last_served = {}
+        self._wakeup = None
+        self._loop_task = None
+        self._ready = None
+        self._watchers = set()
+        self._stopping = False
+
+    def start(self, on_update, ready=None):
+        # ready — awaitable, до которого файлы не запускаются (прогрев forkserver,
+        # см. ScoringExecutor.warm_up): иначе первый запуск процесса ждет его в event loop
+        self.on_update = on_update
+        self._ready = ready
+        self._wakeup = asyncio.Event()
+        self.queue.recover()
+        self._loop_task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _dispatch(self):
+        if self._ready is not None:
+            await asyncio.wait([asyncio.ensure_future(self._ready)])
+        while True:
+            self._wakeup.clear()
+            while len(self.running) < self.limit:
+                if self.slots is not None:
+                    await self.slots.acquire()
+                task = self.queue.next_task(self.last_served)
+                if task is None:
+                    self._release()
+                    break
+                self._launch(task)
+            await self._wakeup.wait()
+
+    def _release(self):
+        if self.slots is not None:
+            self.slots.release()
+
+    def _launch(self, task):
+        self.queue.start(task['id'])
+        self.last_served[task['user_id']] = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            args = self.job_args(task)
+        except Exception as e:
+            # Например, файл удалили, пока задача ждала в очереди
+            self.queue.finish(task['id'], FAILED, error=str(e))
+            self._release()
+            loop.create_task(self._update(task['batch_id'], self.queue.task(task['id']), 'finished'))
+            return
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=_run_child, args=(sender, self.fn, args), daemon=True)
+        process.start()
+        sender.close()
+        self.running[task['id']] = (task['user_id'], process)
+        watcher = loop.create_task(self._watch(task, process, receiver))
+        self._watchers.add(watcher)
+        watcher.add_done_callback(self._watchers.discard)
+
+    async def _receive(self, receiver):
+        # Ждем данные (или закрытие pipe при убитом процессе) без отдельного потока
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(receiver.fileno(), lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(receiver.fileno())
+        try:
+            return receiver.recv()
+        except EOFError:
+            return None
+        finally:
+            receiver.close()
+
+    async def _watch(self, task, process, receiver):
+        await self._update(task['batch_id'], task, 'started')
+        try:
+            message = await self._receive(receiver)
+            await asyncio.get_running_loop().run_in_executor(None, process.join)
+        finally:
+            self.running.pop(task['id'], None)
+            self._release()
+        if self._stopping:
+            # Бот останавливается: задача остается running и продолжится после перезапуска
+            return
+        payload = None
+        if task['id'] in self.cancelled:
+            self.cancelled.discard(task['id'])
+            self.queue.finish(task['id'], CANCELLED)
+        elif message is None:
+            self.queue.finish(task['id'], FAILED, error=f"воркер завершился с кодом {process.exitcode}")
+        elif message[0]:
+            result, payload = message[1]
+            self.queue.finish(task['id'], DONE, result=result)
+        else:
+            self.queue.finish(task['id'], FAILED, error=message[1])
+        self.notify()
+        await self._update(task['batch_id'], self.queue.task(task['id']), 'finished', payload)
+
+    async def _update(self, batch_id, task, event, payload=None):
+        try:
+            await self.on_update(batch_id, task, event, payload)
+        except Exception as e:
+            print(f"Ошибка обновления батча {batch_id}: {e}")
+
+    async def cancel(self, user_id):
+        # Очередь пользователя снимается, работающие процессы убиваются;
+        # возвращает число отмененных файлов
+        batches, count = self.queue.cancel_user(user_id)
+        running_batches = set()
+        for task_id, (owner, process) in list(self.running.items()):
+            if owner == user_id:
+                self.cancelled.add(task_id)
+                running_batches.add(self.queue.task(task_id)['batch_id'])
+                process.terminate()
+                count += 1
+        # Батчи с убитыми процессами обновит _watch, остальные — здесь
+        for batch_id in batches:
+            if batch_id not in running_batches:
+                await self._update(batch_id, None, 'cancelled')
+        return count
+
+    def shutdown(self):
+        # Задачи остаются в статусе running и после перезапуска снова встанут в очередь
+        self._stopping = True
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+        for _, process in self.running.values():
+            process.terminate()
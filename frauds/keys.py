@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# Целочисленные ключи сущностей. Текстовые ключи (email, имя, IP, user agent,
+# номер карты) читаются словарем — pandas Categorical: коды int8..int32 плюс
+# уникальные строки, без Python-строки на каждую строку выгрузки. Строковые
+# операции (срез BIN и последних 4 цифр, BIN как текст) выполняются только над
+# уникальными значениями. Группировки движка идут по кодам, составной ключ
+# карты упаковывается в один int64
+
+
+def _is_dictionary(values):
+    return isinstance(values.dtype, pd.CategoricalDtype)
+
+
+def map_unique(values, fn, missing=np.nan):
+    # fn(уникальные значения: Index) -> значения той же длины; пропуски
+    # получают missing. Результат того же вида, что и вход: словарь остается
+    # словарем, остальное — object-колонкой
+    if _is_dictionary(values):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    # Последний элемент — для пропусков (код -1)
+    mapped = np.append(np.asarray(fn(pd.Index(uniques)), dtype=object), missing)
+    if _is_dictionary(values):
+        mapped_codes, categories = pd.factorize(mapped)
+        return pd.Series(pd.Categorical.from_codes(mapped_codes[codes], categories), index=values.index)
+    return pd.Series(mapped[codes], index=values.index)
+
+
+def encode(values):
+    # Значения -> (коды, уникальные значения): коды 0..n-1 в порядке сортировки
+    # значений, как pd.factorize(sort=True), пропуск -> -1. У словаря
+    # сортируются только используемые категории, строки не хешируются заново
+    if not _is_dictionary(values):
+        return pd.factorize(values, sort=True)
+    codes = values.cat.codes.to_numpy()
+    categories = values.cat.categories
+    used = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(categories)))
+    order = categories[used].argsort()
+    # Старый код категории -> новый; последний элемент — для пропусков
+    recode = np.full(len(categories) + 1, -1, dtype=np.int64)
+    recode[used[order]] = np.arange(len(used))
+    return recode[codes], categories[used[order]]
+
+
+def pack(left, right, n_right):
+    # Пара кодов (например, BIN и последние 4 цифры) -> один int64-ключ 0..n-1
+    # в порядке пар; пропуск в любой части -> -1
+    combined = np.where((left >= 0) & (right >= 0), left.astype(np.int64) * n_right + right, -1)
+    codes, uniques = pd.factorize(combined, sort=True)
+    if len(uniques) and uniques[0] == -1:
+        return codes - 1, len(uniques) - 1
+    return codes, len(uniques)
+
+
+def hashes(values):
+    # Значения -> (uint64-хеши, маска строк со значением). Одинаковое значение дает
+    # один хеш в любом куске и процессе, поэтому хешами можно объединять состояние
+    # разных кусков и выгрузок (frauds.streaming, frauds.store). Хешируются только
+    # уникальные значения; пропуск -> 0
+    if _is_dictionary(values):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    hashed = np.append(pd.util.hash_array(np.asarray(uniques, dtype=object)), np.uint64(0))
+    return hashed[codes], codes >= 0
+
+
+def combine_hashes(left, right):
+    # Хеш составного ключа (BIN, последние 4) из хешей частей
+    return pd.util.hash_array(left * np.uint64(0x9E3779B97F4A7C15) ^ right)
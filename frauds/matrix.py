@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# Матрица признаков одного расчета: значение каждого признака по email и
+# распределение признака по строкам выгрузки, из которого берется порог. По ней
+# флаги и fraud_score пересчитываются с другими весами или перцентилем без
+# повторного чтения и группировок (frauds.pipelines.reweight, /reweight в боте).
+# Файл — подряд записанные .npy-массивы; при загрузке каждый отображается в
+# память (np.memmap), читаются только нужные страницы
+
+MATRIX_VERSION = 1
+
+
+def distribution(values, counts):
+    # Значения сущностей и сколько строк у каждого -> (разные значения по
+    # возрастанию, накопленное число строк). Пропуски не участвуют, как в Series.quantile
+    values = np.asarray(values, dtype=float)
+    counts = np.asarray(counts, dtype=np.int64)
+    keep = ~np.isnan(values) & (counts > 0)
+    values, counts = values[keep], counts[keep]
+    order = np.argsort(values, kind='stable')
+    values, cumulative = values[order], np.cumsum(counts[order])
+    if not len(values):
+        # Пустая выгрузка или все строки отброшены фильтрами провайдера
+        return values, cumulative
+    # Равные значения схлопываются в одно с последним накопленным числом
+    last = np.append(values[1:] != values[:-1], True)
+    return values[last], cumulative[last]
+
+
+def quantile(distribution, q):
+    # Перцентиль по строкам двумя searchsorted. Та же линейная интерполяция,
+    # что и у Series.quantile / np.percentile
+    values, cumulative = distribution
+    if not len(values):
+        return np.nan
+    n = int(cumulative[-1])
+    virtual_index = (n - 1) * q
+    previous_index = np.floor(virtual_index)
+    gamma = virtual_index - previous_index
+    lo = int(previous_index)
+    hi = min(lo + 1, n - 1)
+    below = values[np.searchsorted(cumulative, lo, side='right')]
+    above = values[np.searchsorted(cumulative, hi, side='right')]
+    diff = above - below
+    if gamma >= 0.5:
+        return above - diff * (1 - gamma)
+    return below + diff * gamma
+
+
+class FeatureMatrix:
+    # values — email x признак; distributions[j] — distribution() для порога
+    # признака j или None, если признак — флаг без порога (geo_mismatch)
+
+    def __init__(self, provider, features, emails, values, distributions):
+        self.provider = provider
+        self.features = list(features)
+        self.emails = emails
+        self.values = values
+        self.distributions = distributions
+
+    def thresholds(self, percentile=0.95):
+        return [np.nan if rows is None else quantile(rows, percentile) for rows in self.distributions]
+
+    def flags(self, percentile=0.95):
+        flags = np.zeros(self.values.shape, dtype=bool)
+        for j, threshold in enumerate(self.thresholds(percentile)):
+            if self.distributions[j] is None:
+                flags[:, j] = self.values[:, j] != 0
+            else:
+                flags[:, j] = self.values[:, j] > threshold
+        return flags
+
+    def save(self, path):
+        arrays = {
+            # По столбцам: флаги считаются по признаку, каждый столбец читается подряд
+            'values': np.asfortranarray(self.values, dtype=float),
+            # Email одной строкой через '\0': разбирается одним split, а не по одному
+            'emails': np.frombuffer('\0'.join(map(str, self.emails)).encode(), dtype=np.uint8),
+        }
+        for j, rows in enumerate(self.distributions):
+            if rows is not None:
+                arrays[f'distribution_values_{j}'] = np.asarray(rows[0], dtype=float)
+                arrays[f'distribution_rows_{j}'] = np.asarray(rows[1], dtype=np.int64)
+        meta = {'version': MATRIX_VERSION, 'provider': self.provider, 'features': self.features,
+                'emails': len(self.emails), 'arrays': list(arrays)}
+        # Через свой временный файл той же папки: /reweight не прочитает недописанную
+        # матрицу, а два процесса, пишущие одну матрицу, не пишут в один файл
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8))
+                for array in arrays.values():
+                    np.save(f, array)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        arrays = {}
+        with open(path, 'rb') as f:
+            meta = json.loads(np.load(f).tobytes())
+            if meta['version'] != MATRIX_VERSION:
+                raise ValueError(f"матрица признаков версии {meta['version']}, нужна {MATRIX_VERSION}")
+            for name in meta['arrays']:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                offset = f.tell()
+                size = int(np.prod(shape)) * dtype.itemsize
+                if size:
+                    arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                                             order='F' if fortran_order else 'C')
+                else:
+                    arrays[name] = np.empty(shape, dtype=dtype)
+                f.seek(offset + size)
+
+        distributions = [
+            (arrays[f'distribution_values_{j}'], arrays[f'distribution_rows_{j}'])
+            if f'distribution_values_{j}' in arrays else None
+            for j in range(len(meta['features']))
+        ]
+        emails = arrays['emails'].tobytes().decode().split('\0') if meta['emails'] else []
+        emails = np.array(emails, dtype=object)
+        return cls(meta['provider'], meta['features'], emails, arrays['values'], distributions)
@@ -0,0 +1,129 @@
+import math
+import os
+import resource
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Замеры этапов расчета. В процессе-воркере stage() записывает время, число
+# строк и максимальный RSS процесса к концу этапа между start() и take(). RSS —
+# ru_maxrss, максимум за всю жизнь процесса: он не уменьшается между этапами и
+# задачами, поэтому это «максимум к этому моменту», а не память самого этапа;
+# вне этого окна замеры не копятся. В боте StageStats держит последние замеры по
+# (провайдер, этап) для /stats и файла метрик в текстовом формате Prometheus.
+# Модуль без pandas: его импортирует и основной процесс бота
+
+QUANTILES = (0.5, 0.95)
+
+_records = None
+
+
+def peak_rss_mb():
+    # Максимальный RSS процесса с его запуска
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def start():
+    global _records
+    _records = []
+
+
+@contextmanager
+def stage(name, rows=None):
+    # Число строк можно указать и внутри блока: record['rows'] = len(df)
+    record = {'stage': name, 'rows': rows}
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        if _records is not None:
+            record['seconds'] = time.perf_counter() - started
+            record['peak_mb'] = peak_rss_mb()
+            _records.append(record)
+
+
+def take():
+    # Этап -> {'seconds', 'rows', 'peak_mb'} с момента start(). Повторяющиеся
+    # этапы (куски потокового чтения) суммируются
+    global _records
+    stages = {}
+    for record in _records or ():
+        total = stages.setdefault(record['stage'], {'seconds': 0.0, 'rows': None, 'peak_mb': 0.0})
+        total['seconds'] += record['seconds']
+        if record['rows'] is not None:
+            total['rows'] = (total['rows'] or 0) + record['rows']
+        total['peak_mb'] = max(total['peak_mb'], record['peak_mb'])
+    _records = None
+    return stages
+
+
+def _quantile(values, q):
+    # Ближайший ранг: без numpy и интерполяции
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+class StageStats:
+    # Последние size замеров на (провайдер, этап) для перцентилей и накопительные
+    # суммы с запуска бота (для _sum/_count в Prometheus)
+
+    def __init__(self, size=500):
+        self.samples = defaultdict(lambda: deque(maxlen=size))
+        self.totals = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'rows': 0})
+
+    def record(self, provider, stage, seconds, rows=None, peak_mb=None):
+        self.samples[(provider, stage)].append((seconds, rows, peak_mb))
+        total = self.totals[(provider, stage)]
+        total['count'] += 1
+        total['seconds'] += seconds
+        total['rows'] += rows or 0
+
+    def record_job(self, provider, stages):
+        for name, values in stages.items():
+            self.record(provider, name, values['seconds'], values['rows'], values['peak_mb'])
+
+    def summary(self):
+        # [(провайдер, этап, замеров, p50, p95, медиана строк, максимум памяти МБ)]
+        rows = []
+        for (provider, stage), samples in sorted(self.samples.items()):
+            seconds = [sample[0] for sample in samples]
+            counts = [sample[1] for sample in samples if sample[1] is not None]
+            memory = [sample[2] for sample in samples if sample[2] is not None]
+            rows.append((provider, stage, len(samples), *(_quantile(seconds, q) for q in QUANTILES),
+                         _quantile(counts, 0.5) if counts else None, max(memory) if memory else None))
+        return rows
+
+    def prometheus(self):
+        lines = ["# HELP frauds_stage_seconds Длительность этапа расчета (перцентили по последним замерам)",
+                 "# TYPE frauds_stage_seconds summary"]
+        for (provider, stage), samples in sorted(self.samples.items()):
+            labels = f'provider="{provider}",stage="{stage}"'
+            seconds = [sample[0] for sample in samples]
+            for q in QUANTILES:
+                lines.append(f'frauds_stage_seconds{{{labels},quantile="{q}"}} {_quantile(seconds, q):.6f}')
+            total = self.totals[(provider, stage)]
+            lines.append(f"frauds_stage_seconds_sum{{{labels}}} {total['seconds']:.6f}")
+            lines.append(f"frauds_stage_seconds_count{{{labels}}} {total['count']}")
+        lines += ["# HELP frauds_stage_rows_total Строк обработано этапом",
+                  "# TYPE frauds_stage_rows_total counter"]
+        for (provider, stage), total in sorted(self.totals.items()):
+            lines.append(f'frauds_stage_rows_total{{provider="{provider}",stage="{stage}"}} {total["rows"]}')
+        lines += ["# HELP frauds_stage_peak_rss_bytes Максимальный RSS воркера с его запуска к концу этапа "
+                  "(ru_maxrss, максимум по последним замерам)",
+                  "# TYPE frauds_stage_peak_rss_bytes gauge"]
+        for (provider, stage), samples in sorted(self.samples.items()):
+            memory = [sample[2] for sample in samples if sample[2] is not None]
+            if memory:
+                lines.append(f'frauds_stage_peak_rss_bytes{{provider="{provider}",stage="{stage}"}} '
+                             f'{int(max(memory) * 1024 * 1024)}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Через временный файл: сборщик не увидит наполовину записанный файл
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
@@ -0,0 +1,253 @@
+import cProfile
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from frauds.archives import export_name, is_supported, list_exports, result_name
+from frauds import metrics
+from frauds.cache import file_key
+from frauds.delivery import render_frame
+from frauds.engine import frame_matrix, score_frame, score_matrix
+from frauds.ingest import load_export, preparse
+from frauds.matrix import FeatureMatrix
+from frauds.metrics import stage
+from frauds.providers import PROVIDERS, detect_provider
+from frauds.rings import MAX_ENTITY_EMAILS, MIN_RING_EMAILS, email_scores, export_links, find_rings, read_scores
+from frauds.store import incremental_matrix
+from frauds.streaming import DEFAULT_CHUNKSIZE, streaming_matrix
+from frauds.tasks import matrix_path, streaming_chunksize
+
+
+def _read(spec, path):
+    with stage('read') as record:
+        df = load_export(spec, path)
+        record['rows'] = len(df)
+    return df
+
+
+def score_path(spec, path):
+    return score_frame(spec, _read(spec, path))
+
+
+def preparse_file(path):
+    # Выполняется в процессе-воркере сразу после загрузки: разбор CSV заранее,
+    # чтобы score_export только загрузил готовый кадр. Для файлов без провайдера
+    # ничего не делает — ошибку покажет score_export
+    spec = detect_provider(export_name(path))
+    if spec is None:
+        return None
+    return preparse(spec, path)
+
+
+def _provider(path):
+    filename = export_name(path)
+    spec = detect_provider(filename)
+    if spec is None:
+        raise ValueError(f"не удалось определить провайдера для '{filename}'")
+    return spec
+
+
+def output_path(path, out_dir):
+    # Путь результата выгрузки в out_dir (матрица признаков — рядом, matrix_path)
+    return os.path.join(out_dir, f"result_{_provider(path).df_name}_{result_name(path)}")
+
+
+def score_export(path, out_dir, chunksize=None, cache=None, store=None, distinct_error=None, save_matrix=False,
+                 result_path=None):
+    # Выполняется в процессе-воркере: результат расчета кадром в памяти.
+    # -> (result_path, результат, признак «из кэша»); result_path — имя результата
+    # (по умолчанию output_path в out_dir), файл по нему пишет только score_file.
+    # С chunksize файл читается кусками (см. frauds.streaming), с cache
+    # (frauds.cache.ResultCache) уже посчитанная выгрузка не считается заново:
+    # в кэше лежит матрица признаков, результат по ней пересчитывается за доли секунды.
+    # Со store (frauds.store.FeatureStore) пороги и признаки считаются вместе
+    # с историей прошлых выгрузок; результат тогда зависит от истории и не кэшируется.
+    # С distinct_error уникальные значения в потоковом режиме считаются
+    # приближенно (KMV-скетчи): память состояния ограничена на ключ. Файлы без
+    # chunksize читаются целиком и считаются точно — так быстрее, а память
+    # кадра скетчи не уменьшают. Хранилище признаков работает со своими скетчами.
+    # С save_matrix матрица признаков остается рядом (matrix_path) для reweight и колец
+    spec = _provider(path)
+    result_path = result_path or output_path(path, out_dir)
+    features_path = matrix_path(result_path)
+    key = None
+    cached = False
+    if not chunksize:
+        distinct_error = None
+    if store is not None:
+        matrix = incremental_matrix(path, spec, store, chunksize or DEFAULT_CHUNKSIZE)
+    else:
+        if cache is not None:
+            with stage('hash'):
+                key = file_key(path, spec, f"distinct_error={distinct_error}" if distinct_error else '')
+            with stage('cache'):
+                cached = cache.get(key, features_path)
+                if cached:
+                    matrix = FeatureMatrix.load(features_path)
+        if not cached and chunksize:
+            matrix = streaming_matrix(path, spec, chunksize, distinct_error)
+        elif not cached:
+            matrix = frame_matrix(spec, _read(spec, path))
+
+    with stage('score'):
+        df = score_matrix(spec, matrix)
+    if not cached and (save_matrix or key is not None):
+        with stage('matrix', len(df)):
+            matrix.save(features_path)
+    if key is not None:
+        with stage('cache'):
+            if not cached:
+                cache.put(key, features_path)
+            # Матрица нужна была только кэшу
+            if not save_matrix:
+                os.remove(features_path)
+    return result_path, df, cached
+
+
+def score_file(path, out_dir, chunksize=None, cache=None, store=None, distinct_error=None, save_matrix=False,
+               result_path=None):
+    # score_export с записью результата в CSV (CLI, score_files).
+    # -> (путь к готовому CSV, признак «из кэша»)
+    result_path, df, cached = score_export(path, out_dir, chunksize, cache, store, distinct_error, save_matrix,
+                                           result_path)
+    with stage('write', len(df)):
+        df.to_csv(result_path, index=False)
+    return result_path, cached
+
+
+def reweight(features_path, weights=None, percentile=0.95):
+    # Пересчет рейтинга по сохраненной матрице признаков (см. score_export) с
+    # другими весами ('is_fraud_<признак>' -> вес, остальные — как у провайдера)
+    # и/или перцентилем порога, без чтения выгрузки
+    matrix = FeatureMatrix.load(features_path)
+    return score_matrix(PROVIDERS[f"df_{matrix.provider}"], matrix, weights, percentile)
+
+
+def reweight_document(features_path, name, fmt, weights=None, percentile=0.95, top=20):
+    # Пересчет сразу в формате отправки (frauds.delivery), без файла на диске
+    return render_frame(reweight(features_path, weights, percentile), name, fmt, top)
+
+
+def score_job(path, out_dir, chunksize=None, cache=None, store=None, distinct_error=None, profile_path=None,
+              fmt='csv', top=20):
+    # Задача бота (frauds.jobs.JobRunner): score_export с матрицей признаков и
+    # замерами этапов (frauds.metrics), с profile_path — еще и с дампом cProfile.
+    # Результат сразу готовится в формате отправки (frauds.delivery), CSV на диск
+    # не пишется. -> ((путь матрицы, cached, этапы), документ)
+    metrics.start()
+    args = (path, out_dir, chunksize, cache, store, distinct_error, True)
+    if profile_path is None:
+        result_path, df, cached = score_export(*args)
+    else:
+        profiler = cProfile.Profile()
+        try:
+            result_path, df, cached = profiler.runcall(score_export, *args)
+        finally:
+            profiler.dump_stats(profile_path)
+    with stage('render', len(df)):
+        rendered = render_frame(df, os.path.splitext(os.path.basename(result_path))[0], fmt, top)
+    return (matrix_path(result_path), cached, metrics.take()), rendered
+
+
+def file_links(path, result_path, chunksize=None):
+    # Выполняется в процессе-воркере: связи выгрузки и fraud_score ее email для frauds.rings.
+    # result_path — CSV результата (CLI) или матрица признаков (бот): по ней результат
+    # пересчитывается без чтения CSV
+    spec = detect_provider(export_name(path))
+    if result_path == matrix_path(result_path):
+        scores = email_scores(spec, score_matrix(spec, FeatureMatrix.load(result_path)))
+    else:
+        scores = read_scores(spec, result_path)
+    return (spec.name, *export_links(spec, path, chunksize), scores)
+
+
+def ring_report(results, min_emails=MIN_RING_EMAILS, max_entity_emails=MAX_ENTITY_EMAILS,
+                streaming_threshold_mb=200, chunk_rows=DEFAULT_CHUNKSIZE, jobs=1):
+    # Кольца по уже посчитанным выгрузкам: results — [(путь выгрузки, CSV результата или матрица)].
+    # С jobs > 1 файлы читаются в пуле процессов
+    args = [(path, result_path, streaming_chunksize(path, streaming_threshold_mb, chunk_rows))
+            for path, result_path in results]
+    with stage('links'):
+        if jobs and jobs > 1 and len(args) > 1:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("forkserver")) as pool:
+                files = list(pool.map(file_links, *zip(*args)))
+        else:
+            files = [file_links(*file_args) for file_args in args]
+    with stage('rings'):
+        return find_rings(files, min_emails, max_entity_emails)
+
+
+def _cross_provider(rings):
+    return int(rings['providers'].str.contains(',').sum())
+
+
+def link_results(results, out_path, min_emails=MIN_RING_EMAILS, max_entity_emails=MAX_ENTITY_EMAILS,
+                 streaming_threshold_mb=200, chunk_rows=DEFAULT_CHUNKSIZE, jobs=1):
+    # ring_report в CSV; возвращает (out_path, число колец, из них общих для нескольких провайдеров)
+    rings = ring_report(results, min_emails, max_entity_emails, streaming_threshold_mb, chunk_rows, jobs)
+    rings.to_csv(out_path, index=False)
+    return out_path, len(rings), _cross_provider(rings)
+
+
+def rings_document(results, name, fmt, top=20, min_emails=MIN_RING_EMAILS, max_entity_emails=MAX_ENTITY_EMAILS,
+                   streaming_threshold_mb=200, chunk_rows=DEFAULT_CHUNKSIZE):
+    # ring_report сразу в формате отправки (frauds.delivery), без файла на диске:
+    # (число колец, из них общих для нескольких провайдеров, документ)
+    rings = ring_report(results, min_emails, max_entity_emails, streaming_threshold_mb, chunk_rows)
+    return len(rings), _cross_provider(rings), render_frame(rings, name, fmt, top)
+
+
+def find_exports(paths):
+    # Файлы и папки (без вложенных) -> выгрузки: CSV, сжатые CSV и CSV внутри zip.
+    # Провайдер определяется позже, в score_file, по тем же правилам, что и в боте
+    exports = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                     if is_supported(name) and os.path.isfile(os.path.join(path, name))]
+        else:
+            files = [path]
+        for file in files:
+            exports.extend(list_exports(file))
+    # Файл, указанный дважды (сам и через свою папку), считается один раз
+    return list(dict.fromkeys(exports))
+
+
+def _unique_output_paths(paths, out_dir):
+    # Одноименные выгрузки из разных папок получили бы один результат, и последний
+    # перезаписал бы остальные: к повторам добавляется номер (result_..._report_2.csv).
+    # Для файлов без провайдера — None, ошибку покажет score_file
+    result_paths, taken = {}, set()
+    for path in paths:
+        try:
+            result_path = output_path(path, out_dir)
+        except ValueError:
+            result_paths[path] = None
+            continue
+        stem, ext = os.path.splitext(result_path)
+        number = 1
+        while result_path in taken:
+            number += 1
+            result_path = f"{stem}_{number}{ext}"
+        taken.add(result_path)
+        result_paths[path] = result_path
+    return result_paths
+
+
+def score_files(paths, out_dir, jobs=None, streaming_threshold_mb=200, chunk_rows=DEFAULT_CHUNKSIZE,
+                cache=None, store=None, distinct_error=None):
+    # Считает выгрузки в пуле из jobs процессов и отдает (path, (result_path, cached), error)
+    # по мере готовности. Ошибка одного файла не мешает остальным
+    os.makedirs(out_dir, exist_ok=True)
+    result_paths = _unique_output_paths(paths, out_dir)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("forkserver")) as pool:
+        futures = {
+            pool.submit(score_file, path, out_dir, streaming_chunksize(path, streaming_threshold_mb, chunk_rows),
+                        cache, store, distinct_error, False, result_paths[path]): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
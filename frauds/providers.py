@@ -0,0 +1,295 @@
+import re
+from dataclasses import dataclass
+
+# Реестр провайдеров: чем отличаются выгрузки (имена колонок, разделитель,
+# фильтры, признаки успешной/отклоненной/мошеннической операции, веса).
+# Сами признаки для всех провайдеров считает frauds.engine
+
+
+# Канонические текстовые ключи сущностей: при чтении целиком — словарем (см. frauds.keys)
+TEXT_KEYS = ('email', 'ip', 'name', 'ua')
+
+
+@dataclass(frozen=True)
+class Rule:
+    # Условие на строку выгрузки: column <op> value
+    column: str
+    op: str
+    value: object = None
+
+    def mask(self, df):
+        col = df[self.column]
+        if self.op == '==':
+            return col == self.value
+        if self.op == '!=':
+            return col != self.value
+        if self.op == 'isin':
+            return col.isin(self.value)
+        if self.op == 'notna':
+            return col.notna()
+        raise ValueError(f"неизвестная операция '{self.op}'")
+
+
+@dataclass(frozen=True)
+class TextSlice:
+    # Часть текстовой колонки, например BIN и последние 4 цифры из маскированного номера карты
+    column: str
+    start: int = None
+    stop: int = None
+
+    def extract(self, values):
+        return values.str[self.start:self.stop]
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    name: str
+    # Регулярное выражение для начала имени файла (без учета регистра)
+    filename_pattern: str
+    sep: str
+    # Каноническое имя -> колонка выгрузки (или TextSlice). Канонические имена:
+    # email, operation, card_bin, card_last_four, ip, ua, name, amount, time (время
+    # операции для признаков скорости, колонка должна быть в dates)
+    columns: dict
+    weights: dict
+    # Пара колонок (страна карты/платежа, страна IP) для geo_mismatch
+    countries: tuple = None
+    # Пустая страна тоже считается несовпадением
+    geo_missing_is_mismatch: bool = False
+    # BIN сравнивается как строка: пустой BIN считается отдельным значением
+    bins_as_text: bool = False
+    bin_prefix: int = None
+    # Строки, которые остаются в расчете (все условия сразу)
+    filters: tuple = ()
+    success: tuple = ()
+    decline: tuple = ()
+    fraud: tuple = ()
+    failed_3ds: tuple = ()
+    # Делить итоговый score на сумму весов
+    normalize_score: bool = False
+    # Типы колонок при чтении: малокардинальные поля (статусы, типы, страны) — category
+    dtypes: dict = None
+    # Колонки с датами: при чтении переводятся в datetime (UTC), ошибки -> NaT
+    dates: tuple = ()
+
+    @property
+    def df_name(self):
+        return f"df_{self.name}"
+
+    @property
+    def score_column(self):
+        return f"fraud_score_{self.name}"
+
+    @property
+    def email_column(self):
+        return self.columns['email']
+
+    def source_columns(self, canonical):
+        source = self.columns.get(canonical)
+        return [source.column if isinstance(source, TextSlice) else source] if source is not None else []
+
+    @property
+    def key_columns(self):
+        # Текстовые колонки ключей, включая номера карт, из которых берется срез
+        columns = [source.column for source in self.columns.values() if isinstance(source, TextSlice)]
+        for canonical in TEXT_KEYS:
+            columns.extend(self.source_columns(canonical))
+        return list(dict.fromkeys(columns))
+
+    @property
+    def usecols(self):
+        # Только колонки, которые реально читает движок
+        columns = []
+        for source in self.columns.values():
+            columns.append(source.column if isinstance(source, TextSlice) else source)
+        columns.extend(self.countries or ())
+        columns.extend(self.dates)
+        for rules in (self.filters, self.success, self.decline, self.fraud, self.failed_3ds):
+            columns.extend(rule.column for rule in rules)
+        return list(dict.fromkeys(columns))
+
+    def matches(self, filename):
+        return re.match(self.filename_pattern, filename, re.IGNORECASE) is not None
+
+
+UPGATE = ProviderSpec(
+    name='upgate',
+    filename_pattern=r'transaction',
+    sep=',',
+    columns={
+        'email': 'payment.email',
+        'operation': 'operationId',
+        'card_bin': 'paymentDetails.CARD_BIN',
+        'card_last_four': 'paymentDetails.CARD_LAST_FOUR_DIGITS',
+        'ua': 'paymentContext.BROWSER_USER_AGENT',
+        'ip': 'paymentContext.IP',
+        'name': 'cardData.cardFullName',
+        'amount': 'payment.amount',
+        'time': 'createdAt',
+    },
+    countries=('payment.countryCode', 'paymentContext.IP_COUNTRY_CODE'),
+    dates=('createdAt', 'payment.createdAt'),
+    bins_as_text=True,
+    filters=(Rule('id', 'notna'),),
+    success=(Rule('transactionType', '==', 'SALE'), Rule('responseCodeStatus', '==', 'SUCCESS')),
+    decline=(Rule('transactionType', '==', 'SALE'), Rule('responseCodeStatus', '==', 'DECLINE')),
+    fraud=(Rule('transactionType', 'isin', ('FRAUD_ALERT', 'CHARGEBACK')),),
+    failed_3ds=(Rule('transactionDetails.THREE_DS_STATUS', 'isin', ('N', 'R', 'U')),),
+    dtypes={
+        'transactionType': 'category',
+        'responseCodeStatus': 'category',
+        'transactionDetails.THREE_DS_STATUS': 'category',
+        'payment.countryCode': 'category',
+        'paymentContext.IP_COUNTRY_CODE': 'category',
+    },
+    weights={
+        'is_fraud_failed_3ds_per_email': 0.25,
+        'is_fraud_email_operation_count': 0.1,
+        'is_fraud_different_cards_per_email': 0.7,
+        'is_fraud_card_used_by_different_emails': 0.25,
+        'is_fraud_geo_mismatch': 0.1,
+        'is_fraud_ua_variety': 0.15,
+        'is_fraud_unique_bins_per_email': 0.25,
+        'is_fraud_unique_card_names_per_email': 0.2,
+        'is_fraud_unique_emails_per_card_name': 0.25,
+        'is_fraud_large_payment': 0.1,
+        'is_fraud_failure_ratio': 0.15,
+        'is_fraud_fraud_transactions_count': 1,
+        # Признаки скорости (frauds.velocity) считаются и сохраняются в матрице
+        # признаков, но пока не влияют на score: вес задается через /reweight
+        'is_fraud_email_velocity_10m': 0,
+        'is_fraud_email_velocity_1h': 0,
+        'is_fraud_email_velocity_24h': 0,
+        'is_fraud_card_velocity_10m': 0,
+        'is_fraud_card_velocity_1h': 0,
+        'is_fraud_card_velocity_24h': 0,
+        'is_fraud_ip_velocity_10m': 0,
+        'is_fraud_ip_velocity_1h': 0,
+        'is_fraud_ip_velocity_24h': 0,
+    },
+)
+
+UNLIMIT = ProviderSpec(
+    name='unlimit',
+    filename_pattern=r'\d{8}_\d{6}',
+    sep=';',
+    columns={
+        'email': 'Email',
+        'operation': 'Payment ID',
+        'card_bin': TextSlice('Card number', None, 6),
+        'card_last_four': TextSlice('Card number', -4, None),
+        'ip': 'Customer IP',
+        'name': 'Card Holder',
+        'amount': 'Amount',
+    },
+    countries=('IP country', 'Card country'),
+    filters=(Rule('Card type', '!=', 'ewallet'),),
+    success=(Rule('Order type', '==', 'Payment'), Rule('Status', '==', 'Captured')),
+    decline=(Rule('Order type', '==', 'Payment'), Rule('Status', '==', 'Declined')),
+    fraud=(Rule('Status', 'isin', ('Chargeback',)),),
+    dtypes={
+        'Card type': 'category',
+        'Order type': 'category',
+        'Status': 'category',
+        'IP country': 'category',
+        'Card country': 'category',
+    },
+    weights={
+        'is_fraud_email_operation_count': 0.1,
+        'is_fraud_different_cards_per_email': 0.25,
+        'is_fraud_card_used_by_different_emails': 0.25,
+        'is_fraud_geo_mismatch': 0.1,
+        'is_fraud_unique_bins_per_email': 0.25,
+        'is_fraud_unique_card_names_per_email': 0.2,
+        'is_fraud_unique_emails_per_card_name': 0.25,
+        'is_fraud_large_payment': 0.1,
+        'is_fraud_failure_ratio': 0.15,
+        'is_fraud_fraud_transactions_count': 1
+    },
+)
+
+PAYABL = ProviderSpec(
+    name='payabl',
+    filename_pattern=r'report',
+    sep=',',
+    columns={
+        'email': 'EMail',
+        'operation': 'Order No.',
+        'card_bin': 'Credit Card Bin',
+        'card_last_four': TextSlice('Credit Card Number', -4, None),
+        'ip': 'Customer-IP',
+        'name': 'Credit Cardholder',
+        'amount': 'Amount',
+    },
+    countries=('Bin Country', 'IP Country'),
+    geo_missing_is_mismatch=True,
+    success=(Rule('Tx-Type', '==', 'Authorisation'), Rule('Status', '==', 'Successful')),
+    decline=(Rule('Tx-Type', '==', 'Authorisation'), Rule('Status', '==', 'Failed')),
+    fraud=(Rule('Tx-Type', 'isin', ('Chargeback',)),),
+    dtypes={
+        'Tx-Type': 'category',
+        'Status': 'category',
+        'Bin Country': 'category',
+        'IP Country': 'category',
+    },
+    weights={
+        'is_fraud_email_operation_count': 0.1,
+        'is_fraud_different_cards_per_email': 0.25,
+        'is_fraud_card_used_by_different_emails': 0.25,
+        'is_fraud_geo_mismatch': 0.1,
+        'is_fraud_unique_bins_per_email': 0.25,
+        'is_fraud_unique_card_names_per_email': 0.2,
+        'is_fraud_unique_emails_per_card_name': 0.25,
+        'is_fraud_large_payment': 0.1,
+        'is_fraud_failure_ratio': 0.15,
+        'is_fraud_fraud_transactions_count': 1
+    },
+)
+
+CENTROBILL = ProviderSpec(
+    name='centrobill',
+    filename_pattern=r'export',
+    sep=';',
+    columns={
+        'email': 'E-mail',
+        'operation': 'Transaction ID',
+        'card_bin': 'Bin',
+        'card_last_four': 'Last four',
+        'name': 'Customer name',
+        'amount': 'USD Cost',
+    },
+    bins_as_text=True,
+    bin_prefix=6,
+    filters=(Rule('Payment method', 'isin', ('visa', 'mastercard')), Rule('Test', '==', 'no')),
+    success=(Rule('Type', 'isin', ('Initial', 'Non-Recurring', 'Recurring')), Rule('Status', '==', 'success')),
+    decline=(Rule('Type', 'isin', ('Initial', 'Non-Recurring', 'Recurring')), Rule('Status', '==', 'fail')),
+    fraud=(Rule('Type', 'isin', ('Chargeback',)),),
+    dtypes={
+        'Payment method': 'category',
+        'Test': 'category',
+        'Type': 'category',
+        'Status': 'category',
+    },
+    weights={
+        'is_fraud_email_operation_count': 0.1,
+        'is_fraud_different_cards_per_email': 0.25,
+        'is_fraud_card_used_by_different_emails': 0.25,
+        'is_fraud_unique_bins_per_email': 0.25,
+        'is_fraud_unique_card_names_per_email': 0.2,
+        'is_fraud_unique_emails_per_card_name': 0.25,
+        'is_fraud_large_payment': 0.1,
+        'is_fraud_failure_ratio': 0.15,
+        'is_fraud_fraud_transactions_count': 0.5
+    },
+    normalize_score=True,
+)
+
+# Порядок важен: провайдер определяется по первому совпадению
+PROVIDERS = {spec.df_name: spec for spec in (UPGATE, UNLIMIT, PAYABL, CENTROBILL)}
+
+
+def detect_provider(filename):
+    for spec in PROVIDERS.values():
+        if spec.matches(filename):
+            return spec
+    return None
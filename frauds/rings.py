@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+
+from frauds.engine import prepare
+from frauds.ingest import read_chunks, read_export
+from frauds.keys import map_unique
+
+# Кольца мошенников поверх выгрузок разных провайдеров. Каждый файл считается
+# отдельно, поэтому кольцо, которое делит карты или IP между Upgate и Payabl, в
+# результатах по отдельности не видно. Здесь по всем файлам батча строится граф:
+# вершины — email, карты (BIN + последние 4 цифры), IP и имена держателей карт,
+# ребро — email встречался с сущностью в одной строке. Связные компоненты
+# ищутся union-find на массиве (components), без self-join в pandas: время почти
+# линейно по числу ребер. Значения нормализуются одинаково для всех провайдеров
+# (email в нижнем регистре, BIN и последние 4 цифры как цифры с ведущими нулями),
+# иначе одна и та же карта в разных выгрузках выглядит по-разному
+
+# Вид сущности -> канонические колонки
+ENTITIES = {'card': ['card_bin', 'card_last_four'], 'ip': ['ip'], 'name': ['name']}
+# Сущность больше чем у стольких email — не связь, а общее место (NAT-адрес,
+# «JOHN SMITH»): через нее склеилось бы все
+MAX_ENTITY_EMAILS = 50
+# Кольцо — компонента хотя бы из стольких email
+MIN_RING_EMAILS = 3
+# Сколько email с наибольшим score показывать в отчете по кольцу
+TOP_EMAILS = 5
+
+RING_COLUMNS = ['ring', 'emails', 'providers', 'cards', 'ips', 'names', 'fraud_score', 'top_emails']
+
+
+def _text(uniques, case):
+    # Один проход Python по уникальным значениям быстрее цепочки .str
+    if case == 'lower':
+        values = [str(value).strip().lower() for value in uniques]
+    else:
+        values = [' '.join(str(value).upper().split()) for value in uniques]
+    return [value or np.nan for value in values]
+
+
+def _digits(uniques, width):
+    # 520001, 520001.0 и '520001' -> '520001'; последние 4 цифры с ведущими нулями
+    numbers = pd.to_numeric(uniques.astype(str).str.strip(), errors='coerce')
+    return [np.nan if np.isnan(number) else f"{int(number):0{width}d}" for number in numbers]
+
+
+NORMALIZE = {
+    'email': lambda uniques: _text(uniques, 'lower'),
+    'ip': lambda uniques: _text(uniques, 'lower'),
+    'name': lambda uniques: _text(uniques, 'upper'),
+    'card_bin': lambda uniques: _digits(uniques, 6),
+    'card_last_four': lambda uniques: _digits(uniques, 4),
+}
+
+
+def _normalized(frame, column):
+    # Коды по строкам и нормализованные уникальные значения (строки считаются
+    # только по уникальным). Порядок кодов не важен, поэтому без сортировки keys.encode
+    values = map_unique(frame[column], NORMALIZE[column])
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), np.asarray(values.cat.categories, dtype=object)
+    codes, uniques = pd.factorize(values)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def _entity_codes(frame, kind):
+    if kind != 'card':
+        return _normalized(frame, ENTITIES[kind][0])
+    (bin_codes, bins), (four_codes, fours) = _normalized(frame, 'card_bin'), _normalized(frame, 'card_last_four')
+    valid = (bin_codes >= 0) & (four_codes >= 0)
+    codes = np.full(len(frame), -1, dtype=np.int64)
+    codes[valid], cards = pd.factorize(bin_codes[valid].astype(np.int64) * len(fours) + four_codes[valid])
+    return codes, bins[cards // len(fours)] + ':' + fours[cards % len(fours)]
+
+
+def frame_links(frame):
+    # Канонический кадр (prepare) -> (email, {вид сущности: (коды email, коды
+    # значений, значения)}): уникальные пары email — сущность; email и значения —
+    # нормализованные строки, по одному разу
+    email_codes, emails = _normalized(frame, 'email')
+    links = {}
+    for kind, columns in ENTITIES.items():
+        if not all(col in frame for col in columns):
+            continue
+        value_codes, values = _entity_codes(frame, kind)
+        n_values = max(len(values), 1)
+        valid = (email_codes >= 0) & (value_codes >= 0)
+        pairs = pd.unique(email_codes[valid].astype(np.int64) * n_values + value_codes[valid])
+        links[kind] = pairs // n_values, pairs % n_values, values
+    return emails, links
+
+
+def _merge_links(parts):
+    # Связи кусков -> связи файла: пары строками, без повторов между кусками
+    pairs = {}
+    for emails, links in parts:
+        for kind, (email_codes, value_codes, values) in links.items():
+            pairs.setdefault(kind, []).append(pd.DataFrame({'email': emails[email_codes],
+                                                            'value': values[value_codes]}))
+    pairs = {kind: pd.concat(frames, ignore_index=True).drop_duplicates() for kind, frames in pairs.items()}
+    all_emails = [emails for emails, _ in parts]
+    email_codes, emails = pd.factorize(np.concatenate(all_emails) if all_emails else np.empty(0, dtype=object))
+    links = {}
+    for kind, frame in pairs.items():
+        value_codes, values = pd.factorize(frame['value'])
+        links[kind] = (pd.Index(emails).get_indexer(frame['email']), value_codes,
+                       np.asarray(values, dtype=object))
+    return np.asarray(emails, dtype=object), links
+
+
+def link_columns(spec):
+    # Колонки выгрузки для связей: ключи сущностей и фильтры провайдера
+    columns = [col for canonical in ['email', *ENTITIES['card'], 'ip', 'name']
+               for col in spec.source_columns(canonical)]
+    columns.extend(rule.column for rule in spec.filters)
+    return list(dict.fromkeys(columns))
+
+
+def export_links(spec, path, chunksize=None):
+    # Связи выгрузки (см. frame_links): читаются только колонки ключей; с
+    # chunksize — кусками, в памяти остаются только уникальные пары
+    columns = link_columns(spec)
+    if chunksize is None:
+        return frame_links(prepare(spec, read_export(spec, path, columns=columns)))
+    return _merge_links([frame_links(prepare(spec, chunk))
+                         for chunk in read_chunks(spec, path, chunksize, columns=columns)])
+
+
+def email_scores(spec, result):
+    # Результат скоринга -> fraud_score по нормализованному email
+    emails = map_unique(result[spec.email_column], NORMALIZE['email'])
+    return result[spec.score_column].groupby(emails.to_numpy()).sum()
+
+
+def read_scores(spec, result_path):
+    # То же для CSV результата на диске
+    return email_scores(spec, pd.read_csv(result_path, usecols=[spec.email_column, spec.score_column]))
+
+
+def _compress(parent):
+    # Перескок через предка, пока каждая вершина не указывает на корень
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return
+        parent[:] = grand
+
+
+def components(n, left, right):
+    # Union-find на массиве parent: за раунд все ребра между разными корнями
+    # подвешивают больший корень к наименьшему из соседних (np.minimum.at: при
+    # обычном parent[high] = low из ребер одного корня выигрывало бы последнее, и
+    # звезда с центром на большем номере собиралась бы по листу за раунд), затем
+    # пути сжимаются до корня. Ребра внутри одной компоненты отбрасываются,
+    # поэтому раунды быстро дешевеют. Указатели идут только к меньшему номеру,
+    # циклов нет. Возвращает корень каждой вершины
+    dtype = np.int32 if n < 2 ** 31 else np.int64
+    parent = np.arange(n, dtype=dtype)
+    left, right = left.astype(dtype, copy=False), right.astype(dtype, copy=False)
+    while len(left):
+        left, right = parent[left], parent[right]
+        cross = left != right
+        left, right = left[cross], right[cross]
+        np.minimum.at(parent, np.maximum(left, right), np.minimum(left, right))
+        _compress(parent)
+    return parent
+
+
+def _factorize(arrays):
+    # Значения из разных файлов -> общие номера: (коды каждого массива, уникальные значения)
+    codes, uniques = pd.factorize(np.concatenate(arrays) if arrays else np.empty(0, dtype=object))
+    return np.split(codes, np.cumsum([len(array) for array in arrays])[:-1]), np.asarray(uniques, dtype=object)
+
+
+def find_rings(files, min_emails=MIN_RING_EMAILS, max_entity_emails=MAX_ENTITY_EMAILS):
+    # files — [(провайдер, email, связи, fraud_score по email)] всех файлов батча
+    # (export_links и read_scores). Вершины графа: сначала все email, затем
+    # сущности по видам
+    email_nodes, emails = _factorize([file_emails for _, file_emails, _, _ in files]
+                                     + [np.asarray(scores.index, dtype=object) for _, _, _, scores in files])
+    offsets, n = {}, len(emails)
+    value_nodes = {}
+    for kind in ENTITIES:
+        with_kind = [number for number, (_, _, links, _) in enumerate(files) if kind in links]
+        codes, values = _factorize([files[number][2][kind][2] for number in with_kind])
+        value_nodes[kind] = dict(zip(with_kind, codes))
+        offsets[kind], n = n, n + len(values)
+
+    left, right = [], []
+    for number, (_, _, links, _) in enumerate(files):
+        for kind, (email_codes, value_codes, _) in links.items():
+            left.append(email_nodes[number][email_codes])
+            right.append(offsets[kind] + value_nodes[kind][number][value_codes])
+    left = np.concatenate(left) if left else np.empty(0, dtype=np.int64)
+    right = np.concatenate(right) if right else np.empty(0, dtype=np.int64)
+    # Одна и та же пара из разных файлов — одно ребро
+    edges = pd.unique(left.astype(np.int64) * n + right)
+    left, right = edges // n, edges % n
+    # Сущность одного email ничего не связывает, сущность слишком многих — общее место
+    degree = np.bincount(right, minlength=n)
+    keep = (degree[right] >= 2) & (degree[right] <= max_entity_emails)
+    roots = components(n, left[keep], right[keep])
+
+    email_roots = roots[:len(emails)]
+    sizes = np.bincount(email_roots, minlength=n)
+    ring_roots = np.flatnonzero(sizes >= min_emails)
+    if not len(ring_roots):
+        return pd.DataFrame(columns=RING_COLUMNS)
+
+    scores = np.zeros(len(emails))
+    for number, (_, _, _, file_scores) in enumerate(files):
+        scores += np.bincount(email_nodes[len(files) + number], weights=file_scores.to_numpy(dtype=float),
+                              minlength=len(emails))
+
+    rings = pd.DataFrame({'root': ring_roots, 'emails': sizes[ring_roots]})
+    # Сущности, которые связывают email кольца (общие больше чем для одного email)
+    linked = np.zeros(n, dtype=bool)
+    linked[right[keep]] = True
+    bounds = list(offsets.values()) + [n]
+    for (kind, column), start, stop in zip((('card', 'cards'), ('ip', 'ips'), ('name', 'names')), bounds, bounds[1:]):
+        nodes = np.arange(start, stop)
+        rings[column] = np.bincount(roots[nodes[linked[nodes]]], minlength=n)[ring_roots]
+    rings['fraud_score'] = np.bincount(email_roots, weights=scores, minlength=n)[ring_roots]
+
+    # Провайдеры кольца: файлы, где встречался хоть один его email
+    in_ring = sizes[email_roots] >= min_emails
+    providers = pd.DataFrame({
+        'root': np.concatenate([email_roots[nodes[in_ring[nodes]]] for nodes in email_nodes[:len(files)]]),
+        'provider': np.concatenate([np.full(in_ring[nodes].sum(), provider, dtype=object)
+                                    for (provider, _, _, _), nodes in zip(files, email_nodes)]),
+    })
+    providers = providers.drop_duplicates().sort_values('provider').groupby('root')['provider'].agg(', '.join)
+    in_ring = np.flatnonzero(in_ring)
+    top = pd.DataFrame({'root': email_roots[in_ring], 'email': emails[in_ring], 'score': scores[in_ring]})
+    top = top.sort_values(['score', 'email'], ascending=[False, True]).groupby('root').head(TOP_EMAILS)
+    rings['providers'] = rings['root'].map(providers)
+    rings['top_emails'] = rings['root'].map(top.groupby('root', sort=False)['email'].agg('; '.join))
+
+    rings = rings.sort_values(['fraud_score', 'emails', 'root'], ascending=[False, False, True], ignore_index=True)
+    rings['ring'] = np.arange(1, len(rings) + 1)
+    return rings[RING_COLUMNS]
@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Приближенное число уникальных значений на ключ (KMV, k minimum values): для
+# каждого ключа хранятся k наименьших 64-битных хешей значений. Пока у ключа
+# меньше k разных значений, счет точный; дальше оценка (k - 1) / h_k, где h_k —
+# k-й наименьший хеш, нормированный в [0, 1). Относительная ошибка ~ 1 / sqrt(k - 2).
+# Скетчи объединяются (concat + k наименьших), поэтому подходят для потокового режима.
+# Скетч — кадр из двух uint64-колонок: 'key' (хеш ключа) и 'hash' (хеш значения,
+# frauds.keys.hashes), не больше k строк на ключ по 16 байт
+
+_HASH_RANGE = float(2 ** 64)
+
+
+def sketch_size(error):
+    # Число хешей на ключ для заданной относительной ошибки
+    if not 0 < error < 1:
+        raise ValueError(f"ошибка должна быть в (0, 1), получено {error}")
+    return math.ceil(1 / error ** 2) + 2
+
+
+def unique_pairs(pairs):
+    # Без повторов пар (ключ, хеш): одна хеш-таблица по uint64-номеру пары вместо
+    # drop_duplicates по двум колонкам
+    pair = pairs['key'].to_numpy() * np.uint64(0x9E3779B97F4A7C15) ^ pairs['hash'].to_numpy()
+    return pairs[~pd.Series(pair).duplicated().to_numpy()].reset_index(drop=True)
+
+
+def combine(sketch, k):
+    # Объединение скетчей: по k наименьших разных хешей на ключ. Сортируются
+    # только ключи, у которых хешей больше k (обычно их немного)
+    sketch = unique_pairs(sketch)
+    full = sketch.groupby('key', sort=False)['hash'].transform('size').to_numpy() > k
+    if not full.any():
+        return sketch
+    largest = sketch[full].sort_values('hash', kind='stable')
+    largest = largest[largest.groupby('key', sort=False).cumcount() < k]
+    return pd.concat([sketch[~full], largest], ignore_index=True)
+
+
+def estimate(sketch, k):
+    # Оценка числа уникальных значений на ключ (Series с индексом по хешу ключа)
+    groups = sketch.groupby('key')['hash']
+    kept = groups.size()
+    largest = groups.max().to_numpy(dtype=float) / _HASH_RANGE
+    approx = (k - 1) / np.maximum(largest, 1 / _HASH_RANGE)
+    return pd.Series(np.where(kept.to_numpy() < k, kept.to_numpy(dtype=float), approx), index=kept.index)
@@ -0,0 +1,320 @@
+import numpy as np
+import pandas as pd
+
+from frauds import sketches
+from frauds.engine import COUNTER_FEATURES, DISTINCT_FEATURES, active_features, prepare, score_matrix
+from frauds.ingest import read_chunks
+from frauds.keys import combine_hashes, hashes
+from frauds.matrix import FeatureMatrix, distribution
+from frauds.metrics import stage
+from frauds.velocity import VELOCITY_FEATURES
+
+# Потоковый режим для выгрузок, которые не помещаются в память: файл читается
+# кусками (chunksize), а по ходу чтения копится только состояние по сущностям —
+# уникальные пары (email, карта), (IP, email) и т.п., счетчики строк, первая
+# строка каждого email и число строк на каждую сумму платежа. Ключи и значения
+# хранятся 64-битными хешами (frauds.keys.hashes), строки — только email. Память
+# зависит от числа разных email/карт/IP и разных сумм, а не от числа строк, —
+# кроме пар (email, операция) для BOUNDED_FEATURES. Результат совпадает с обычным
+# пайплайном.
+# С distinct_error вместо всех уникальных пар хранятся KMV-скетчи (frauds.sketches):
+# память на ключ ограничена, число уникальных значений — приближенное
+
+DEFAULT_CHUNKSIZE = 500_000
+
+# Признаки, у которых значение почти уникально на строку (id операции): в точном
+# режиме их пары растут вместе с файлом, ограничивает их только distinct_error.
+# frauds.store хранит для них число уникальных значений на ключ, а не скетч
+BOUNDED_FEATURES = {'email_operation_count'}
+
+
+class _StateBuffer:
+    # Состояние по кускам копится списком и схлопывается (combine), только когда
+    # новые части перерастают уже схлопнутую: каждая строка состояния хешируется
+    # O(log числа кусков) раз, а не заново на каждом куске
+
+    def __init__(self, combine, empty, min_rows=100_000):
+        self.combine = combine
+        self.empty = empty
+        self.min_rows = min_rows
+        self.parts = []
+        self.compacted_rows = 0
+        self.buffered_rows = 0
+
+    def add(self, part):
+        self.parts.append(part)
+        self.buffered_rows += len(part)
+        if self.buffered_rows > max(self.compacted_rows, self.min_rows):
+            self.compact()
+
+    def compact(self):
+        if len(self.parts) > 1:
+            self.parts = [self.combine(pd.concat(self.parts))]
+        self.compacted_rows = len(self.parts[0]) if self.parts else 0
+        self.buffered_rows = 0
+
+    def value(self):
+        # Без единой части (пустая выгрузка) — пустое состояние того же вида
+        if not self.parts:
+            return self.empty()
+        self.compact()
+        return self.parts[0]
+
+
+def _sum_by_index(frame):
+    return frame.groupby(level=0).sum()
+
+
+def _empty_counts(index_dtype=np.uint64):
+    # Как value_counts по хешам (или суммам платежа)
+    return pd.Series(np.empty(0, dtype=np.int64), index=pd.Index(np.empty(0, dtype=index_dtype)))
+
+
+def _empty_pairs():
+    return pd.DataFrame({'key': np.empty(0, dtype=np.uint64), 'hash': np.empty(0, dtype=np.uint64)})
+
+
+def _first_rows(frame):
+    return frame.drop_duplicates(subset='email_key')
+
+
+def key_name(keys):
+    # Колонка хеша ключа в первых строках email и имя набора ключей в frauds.store
+    return ','.join(keys)
+
+
+class _KeyHashes:
+    # Хеши колонок куска: каждая колонка хешируется один раз и переиспользуется
+    # всеми признаками, как _KeyCodes в frauds.engine
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._hashes = {}
+
+    def __getitem__(self, keys):
+        keys = tuple(keys)
+        if keys not in self._hashes:
+            if len(keys) == 1:
+                self._hashes[keys] = hashes(self.frame[keys[0]])
+            else:
+                (left, has_left), (right, has_right) = self[keys[:1]], self[keys[1:]]
+                self._hashes[keys] = combine_hashes(left, right), has_left & has_right
+        return self._hashes[keys]
+
+
+class StreamingScorer:
+    # sketch_size — число хешей на ключ для всех признаков (см. frauds.store);
+    # по умолчанию берется из distinct_error
+
+    def __init__(self, spec, distinct_error=None, sketch_size=None):
+        self.spec = spec
+        self.sketch_size = sketch_size or (sketches.sketch_size(distinct_error) if distinct_error else None)
+        self.features = None
+        self.pairs = {}
+        self.row_counts = {}
+        self.missing_rows = {}
+        self.lookup_keys = []
+        self.counter_columns = []
+        # Уникальные значения на ключ из истории (frauds.store) для BOUNDED_FEATURES
+        self.history_counts = {}
+        self.counters = _StateBuffer(_sum_by_index, self._empty_counters)
+        self.first_rows = _StateBuffer(_first_rows, self._empty_first_rows)
+        # Сумма платежа -> число строк: для порога крупных платежей
+        self.amounts = _StateBuffer(_sum_by_index, lambda: _empty_counts(float))
+
+    def chunks(self, path, chunksize=DEFAULT_CHUNKSIZE):
+        # Ключевые колонки читаются строками, чтобы тип не «прыгал» между кусками:
+        # ключи сущностей — словарем (хешируются только уникальные значения куска),
+        # id операции почти уникален, и словарь для него только медленнее
+        dtype = {col: 'category' for canonical in ('email', 'card_bin', 'card_last_four', 'ip', 'name')
+                 for col in self.spec.source_columns(canonical)}
+        for col in self.spec.source_columns('operation'):
+            dtype[col] = str
+        for col in self.spec.source_columns('amount'):
+            dtype[col] = float
+        return read_chunks(self.spec, path, chunksize, dtype)
+
+    def read(self, path, chunksize=DEFAULT_CHUNKSIZE):
+        chunks = iter(self.chunks(path, chunksize))
+        while True:
+            with stage('read') as record:
+                chunk = next(chunks, None)
+                record['rows'] = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return self._started()
+            with stage('update', len(chunk)):
+                self.update(prepare(self.spec, chunk))
+
+    def _started(self):
+        # Ни одного куска (пустой файл): признаков нет, рейтинг пустой
+        if self.features is None:
+            self._start(pd.DataFrame())
+        return self
+
+    def _start(self, frame):
+        # Признаки скорости не считаются: окно переходит через границы кусков,
+        # а для этого нужны все времена ключа сразу
+        self.features = [feature for feature in active_features(self.spec, frame)
+                         if feature not in VELOCITY_FEATURES]
+        distinct_features = [feature for feature in self.features if feature in DISTINCT_FEATURES]
+        # Наборы ключей, для которых нужны счетчики строк (веса в перцентилях)
+        key_sets = {('email',)} | {tuple(DISTINCT_FEATURES[feature][0]) for feature in distinct_features}
+        self.pairs = {feature: _StateBuffer(self._pairs_combine(), _empty_pairs)
+                      for feature in distinct_features}
+        self.row_counts = {keys: _StateBuffer(_sum_by_index, _empty_counts) for keys in key_sets}
+        self.missing_rows = dict.fromkeys(key_sets, 0)
+        # Ключи сущностей, значение которых берется по первой строке email
+        self.lookup_keys = sorted(keys for keys in key_sets if keys != ('email',))
+        self.counter_columns = sorted({col for feature in self.features if feature in COUNTER_FEATURES
+                                       for col in COUNTER_FEATURES[feature]})
+
+    def _empty_counters(self):
+        return pd.DataFrame({col: np.empty(0, dtype=np.int64) for col in self.counter_columns},
+                            index=pd.Index(np.empty(0, dtype=np.uint64)))
+
+    def _empty_first_rows(self):
+        columns = {'email_key': np.empty(0, dtype=np.uint64), 'email': np.empty(0, dtype=object)}
+        for keys in self.lookup_keys:
+            columns[key_name(keys)] = np.empty(0, dtype=np.uint64)
+        return pd.DataFrame(columns)
+
+    def _pairs_combine(self):
+        k = self.sketch_size
+        if k is None:
+            return sketches.unique_pairs
+        return lambda sketch: sketches.combine(sketch, k)
+
+    def update(self, chunk):
+        if self.features is None:
+            self._start(chunk)
+        key_hashes = _KeyHashes(chunk)
+
+        for feature, pairs in self.pairs.items():
+            keys, value, _ = DISTINCT_FEATURES[feature]
+            (keys_hash, has_key), (values_hash, has_value) = key_hashes[keys], key_hashes[[value]]
+            valid = has_key & has_value
+            pairs.add(self._pairs_combine()(pd.DataFrame({'key': keys_hash[valid],
+                                                                 'hash': values_hash[valid]})))
+
+        for keys, counts in self.row_counts.items():
+            keys_hash, has_key = key_hashes[keys]
+            counts.add(pd.Series(keys_hash[has_key]).value_counts(sort=False))
+            self.missing_rows[keys] += int((~has_key).sum())
+
+        emails_hash, has_email = key_hashes[['email']]
+        if self.counter_columns:
+            counters = chunk.loc[has_email, self.counter_columns]
+            self.counters.add(counters.groupby(emails_hash[has_email]).sum())
+
+        # Первая строка каждого email — по ней считаются флаги email
+        _, first = np.unique(emails_hash[has_email], return_index=True)
+        rows = np.flatnonzero(has_email)[np.sort(first)]
+        first_rows = pd.DataFrame({'email_key': emails_hash[rows],
+                                   'email': chunk['email'].take(rows).to_numpy(dtype=object)})
+        for keys in self.lookup_keys:
+            first_rows[key_name(keys)] = key_hashes[keys][0][rows]
+        for col in ('geo_mismatch', 'amount'):
+            if col in chunk:
+                first_rows[col] = chunk[col].take(rows).to_numpy()
+        self.first_rows.add(first_rows)
+
+        if 'amount' in chunk:
+            self.amounts.add(chunk['amount'].astype(float).value_counts())
+
+    def merge(self, state):
+        # Добавляет накопленное состояние других выгрузок (см. frauds.store):
+        # пороги и уникальные значения считаются по всем, флаги — по email этой выгрузки
+        for feature, pairs in self.pairs.items():
+            if feature in state['pairs']:
+                pairs.add(state['pairs'][feature])
+            if feature in state['counts']:
+                self.history_counts[feature] = state['counts'][feature]
+        for keys, counts in self.row_counts.items():
+            if keys in state['row_counts']:
+                counts.add(state['row_counts'][keys])
+            self.missing_rows[keys] += state['missing_rows'].get(keys, 0)
+        if self.counter_columns and len(state['counters']):
+            self.counters.add(state['counters'].reindex(columns=self.counter_columns, fill_value=0))
+        if len(state['amounts']):
+            self.amounts.add(state['amounts'])
+        return self
+
+    def distinct_values(self, feature):
+        # Число уникальных значений на хеш ключа (без истории BOUNDED_FEATURES)
+        pairs = self.pairs[feature].value()
+        k = self.sketch_size
+        if k is None:
+            return pairs.groupby('key').size().astype(float)
+        return sketches.estimate(pairs, k)
+
+    def _entity_values(self, feature):
+        # Значения ключей, значение для строк без ключа и распределение по строкам.
+        # Ключи, у которых все значения пустые, в парах не встречаются: у них 0 уникальных
+        keys, _, fill = DISTINCT_FEATURES[feature]
+        counts = self.row_counts[tuple(keys)].value()
+        values = self.distinct_values(feature)
+        if feature in self.history_counts:
+            values = values.add(self.history_counts[feature], fill_value=0)
+        values = values.reindex(counts.index, fill_value=0)
+        if fill is None:
+            return values, fill, distribution(values.to_numpy(dtype=float), counts.to_numpy())
+        rows = distribution(np.append(values.to_numpy(dtype=float), fill),
+                            np.append(counts.to_numpy(), self.missing_rows[tuple(keys)]))
+        return values, fill, rows
+
+    def _email_counter_values(self, feature):
+        counters = self.counters.value()
+        if feature == 'failure_ratio':
+            # Отношение отказов к успешным: только для email, у которых есть успешные
+            return (counters['is_decline'] / counters['is_success']).where(counters['is_success'] > 0, 0)
+        return counters[COUNTER_FEATURES[feature][0]]
+
+    def matrix(self):
+        self._started()
+        # Email по возрастанию, как в обычном пайплайне (frauds.keys.encode)
+        first_rows = self.first_rows.value().sort_values('email', kind='stable')
+        emails = pd.Index(first_rows['email'].to_numpy(dtype=object))
+        email_keys = first_rows['email_key'].to_numpy()
+        # Строки по всем email состояния (после merge их больше, чем в этой выгрузке)
+        email_counts = self.row_counts[('email',)].value()
+        emails_missing = self.missing_rows[('email',)]
+
+        values = np.empty((len(emails), len(self.features)))
+        distributions = []
+        for j, feature in enumerate(self.features):
+            if feature == 'geo_mismatch':
+                values[:, j] = first_rows['geo_mismatch'].astype(bool)
+                distributions.append(None)
+            elif feature == 'large_payment':
+                amounts = self.amounts.value()
+                values[:, j] = first_rows['amount'].astype(float)
+                distributions.append(distribution(amounts.index, amounts.to_numpy()))
+            elif feature in DISTINCT_FEATURES:
+                keys, _, _ = DISTINCT_FEATURES[feature]
+                entity_values, fill, rows = self._entity_values(feature)
+                # Значение сущности из первой строки email (карта, IP, имя); у строки
+                # без ключа хеш 0 — его нет среди ключей, значение берется из fill
+                lookup = email_keys if keys == ['email'] else first_rows[key_name(keys)].to_numpy()
+                email_values = entity_values.reindex(lookup)
+                if fill is not None:
+                    email_values = email_values.fillna(fill)
+                values[:, j] = email_values.astype(float)
+                distributions.append(rows)
+            else:
+                all_values = self._email_counter_values(feature).reindex(email_counts.index, fill_value=0)
+                values[:, j] = all_values.reindex(email_keys).astype(float)
+                distributions.append(distribution(np.append(all_values.to_numpy(dtype=float), 0),
+                                                  np.append(email_counts.to_numpy(), emails_missing)))
+        return FeatureMatrix(self.spec.name, self.features, emails, values, distributions)
+
+
+def streaming_matrix(path, spec, chunksize=DEFAULT_CHUNKSIZE, distinct_error=None):
+    scorer = StreamingScorer(spec, distinct_error).read(path, chunksize)
+    with stage('features'):
+        return scorer.matrix()
+
+
+def score_streaming(path, spec, chunksize=DEFAULT_CHUNKSIZE, distinct_error=None):
+    matrix = streaming_matrix(path, spec, chunksize, distinct_error)
+    with stage('score'):
+        return score_matrix(spec, matrix)
@@ -0,0 +1,42 @@
+import os
+
+from frauds.archives import export_size
+
+# Задачи бота для процессов-воркеров без pandas и numpy в самом боте: функции
+# здесь только передаются в пул или JobRunner (pickle — по имени) и импортируют
+# frauds.pipelines уже в воркере. Воркеры форкаются из forkserver, в котором
+# пайплайны импортированы и прогреты заранее (frauds.warmup), поэтому импорт
+# там ничего не стоит. Здесь же — то, что бот вычисляет сам: размер файла для
+# потокового режима и путь матрицы признаков
+
+
+def matrix_path(result_path):
+    # Файл матрицы по имени результата (frauds.matrix); для самой матрицы — тот же путь
+    return f"{os.path.splitext(result_path)[0]}.features"
+
+
+def streaming_chunksize(path, threshold_mb, chunk_rows):
+    # Большие выгрузки не читаем целиком, а считаем потоково кусками по chunk_rows строк
+    if export_size(path) > threshold_mb * 1024 * 1024:
+        return chunk_rows
+    return None
+
+
+def preparse_file(*args):
+    from frauds.pipelines import preparse_file
+    return preparse_file(*args)
+
+
+def score_job(*args):
+    from frauds.pipelines import score_job
+    return score_job(*args)
+
+
+def reweight_document(*args):
+    from frauds.pipelines import reweight_document
+    return reweight_document(*args)
+
+
+def rings_document(*args):
+    from frauds.pipelines import rings_document
+    return rings_document(*args)
@@ -0,0 +1,56 @@
+import numpy as np
+
+# Признаки скорости: сколько операций сущности (email, карта, IP) попадает в
+# скользящее окно — 10 минут, час, сутки. Значение сущности — максимум по ее
+# операциям, поэтому 40 попыток за 5 минут отличаются от 40 попыток за месяц.
+# Считается одной сортировкой по (ключ, время) и searchsorted на окно — O(n log n),
+# без циклов по группам. Нужна каноническая колонка time (см. ProviderSpec.dates)
+
+WINDOWS = {'10m': 600, '1h': 3600, '24h': 86400}
+ENTITIES = {'email': ['email'], 'card': ['card_bin', 'card_last_four'], 'ip': ['ip']}
+
+# Признак -> (ключ, окно в секундах)
+VELOCITY_FEATURES = {
+    f'{entity}_velocity_{window}': (keys, seconds)
+    for entity, keys in ENTITIES.items() for window, seconds in WINDOWS.items()
+}
+
+_NAT = np.iinfo(np.int64).min
+# Единицы времени для упаковки: миллисекунды, а если ключей и времени слишком
+# много для int64 — секунды
+_UNITS = (10 ** 6, 10 ** 9)
+
+
+def _pack(keys, times, n_keys, max_window):
+    # (ключ, время) -> один int64, упорядоченный как пара. Между ключами зазор
+    # больше окна, поэтому окно одного ключа не заходит на соседний
+    for unit in _UNITS:
+        offsets = (times - times.min()) // unit
+        span = int(offsets.max()) + max_window * (10 ** 9 // unit) + 1
+        if n_keys * span < 2 ** 62:
+            return keys * span + offsets, span, 10 ** 9 // unit
+    raise ValueError("слишком большой диапазон времени для признаков скорости")
+
+
+def window_counts(key_codes, n_keys, times, windows):
+    # key_codes — коды ключа по строкам (-1 — нет ключа), times — datetime64[ns]
+    # (NaT — нет времени). -> {окно в секундах: максимум операций ключа за окно,
+    # включая границы}. У ключей без времени — NaN, они не участвуют в пороге
+    times = times.view(np.int64)
+    valid = (key_codes >= 0) & (times != _NAT)
+    result = {seconds: np.full(n_keys, np.nan) for seconds in windows}
+    if not valid.any():
+        return result
+
+    packed, span, per_second = _pack(key_codes[valid].astype(np.int64), times[valid], n_keys, max(windows))
+    packed.sort()
+    # Строки ключа идут подряд: начало каждого ключа в отсортированном массиве
+    keys = packed // span
+    starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+    # Окно, заканчивающееся на i-й операции: строки до i включительно. Равные
+    # времена недосчитываются у всех, кроме последней, — на максимум это не влияет
+    until = np.arange(1, len(packed) + 1)
+    for seconds in windows:
+        counts = until - np.searchsorted(packed, packed - seconds * per_second, side='left')
+        result[seconds][keys[starts]] = np.maximum.reduceat(counts, starts)
+    return result
@@ -0,0 +1,64 @@
+import io
+import os
+import tempfile
+import time
+
+from frauds.pipelines import score_path
+from frauds.providers import PROVIDERS
+
+# Прогрев процессов-воркеров. Модуль указывается в set_forkserver_preload (см.
+# frauds.jobs.JobRunner): forkserver один раз при старте бота импортирует
+# pandas, numpy, pyarrow и пайплайны и прогоняет каждого провайдера на выгрузке
+# из нескольких строк — ленивые импорты внутри pandas, разбор CSV, признаки,
+# запись результата. Воркеры пула и процессы файлов форкаются из уже прогретого
+# forkserver, и первый /done после перезапуска считается так же быстро, как
+# следующие. Бот в это время уже отвечает: сам он pandas не импортирует
+
+ROWS = 4
+
+
+def _value(column, rules, row):
+    # Значение, при котором строка проходит фильтры провайдера и считается успешной
+    for rule in rules:
+        if rule.column != column:
+            continue
+        if rule.op == '==':
+            return str(rule.value)
+        if rule.op == 'isin':
+            return str(rule.value[0])
+    # Числа подходят и для сумм, и для BIN, и для текстовых ключей
+    return str(400000 + row // 2 % 2)
+
+
+def sample_export(spec, directory):
+    # Несколько строк с колонками, которые читает движок: два email на одной карте и IP
+    columns = spec.usecols
+    rules = (*spec.filters, *spec.success)
+    fixed = {spec.email_column: [f"user{row % 2}@mail.com" for row in range(ROWS)]}
+    for col in spec.dates:
+        fixed[col] = [f"2024-01-01 00:0{row}:00" for row in range(ROWS)]
+    path = os.path.join(directory, f"warmup_{spec.name}.csv")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(spec.sep.join(columns) + '\n')
+        for row in range(ROWS):
+            values = [fixed[col][row] if col in fixed else _value(col, rules, row) for col in columns]
+            f.write(spec.sep.join(values) + '\n')
+    return path
+
+
+def warm_up():
+    # -> {провайдер: секунды}. Ошибка прогрева не мешает боту: настоящий файл ее покажет
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for spec in PROVIDERS.values():
+            started = time.perf_counter()
+            try:
+                score_path(spec, sample_export(spec, directory)).to_csv(io.StringIO(), index=False)
+            except Exception as e:
+                print(f"Прогрев {spec.name} не удался: {e}")
+                continue
+            timings[spec.name] = time.perf_counter() - started
+    return timings
+
+
+TIMINGS = warm_up()
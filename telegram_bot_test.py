@@ -1,550 +1,398 @@
+import asyncio
+import json
 import os
 import sys
-import re
-import pandas as pd
+import time
+from collections import defaultdict
+from functools import partial
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
 )
 
+from frauds.archives import export_name, is_supported, list_exports, split_member
+from frauds.cache import ResultCache
+from frauds.delivery import MESSAGE_LIMIT, available_formats
+from frauds.executor import ScoringExecutor
+from frauds.janitor import sweep
+from frauds.jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobQueue, JobRunner
+from frauds.metrics import StageStats
+from frauds.providers import PROVIDERS, detect_provider
+# Бот не импортирует pandas и numpy и отвечает сразу после старта: расчеты
+# импортируются в воркерах (frauds.tasks), прогретых заранее (frauds.warmup)
+from frauds.tasks import preparse_file, reweight_document, rings_document, score_job, streaming_chunksize
+
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = 344854611 
+# Число процессов для фонового разбора загрузок (по умолчанию — по числу ядер)
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "0")) or None
+# Очередь батчей (переживает перезапуск) и сколько процессов расчета работает
+# одновременно: файлы очереди вместе с фоновым разбором, /reweight и кольцами
+JOBS_DB = os.getenv("JOBS_DB", "jobs.sqlite3")
+MAX_RUNNING_JOBS = int(os.getenv("MAX_RUNNING_JOBS", "0")) or os.cpu_count()
+# Файлы больше этого размера считаются потоково, кусками по STREAMING_CHUNK_ROWS строк
+STREAMING_THRESHOLD_MB = int(os.getenv("STREAMING_THRESHOLD_MB", "200"))
+STREAMING_CHUNK_ROWS = int(os.getenv("STREAMING_CHUNK_ROWS", "500000"))
+# Кэш готовых результатов по содержимому файла (0 МБ — без кэша)
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "cache")
+RESULT_CACHE_MB = int(os.getenv("RESULT_CACHE_MB", "1024"))
+# Хранилище признаков: новые выгрузки считаются вместе с историей за окно в днях
+# (пустой путь — каждый файл считается отдельно, как раньше)
+FEATURE_STORE_PATH = os.getenv("FEATURE_STORE_PATH", "")
+FEATURE_STORE_WINDOW_DAYS = int(os.getenv("FEATURE_STORE_WINDOW_DAYS", "30"))
+# Относительная ошибка приближенного подсчета уникальных значений в потоковом
+# режиме (файлы больше STREAMING_THRESHOLD_MB), например 0.05 (0 — точно)
+APPROX_DISTINCT_ERROR = float(os.getenv("APPROX_DISTINCT_ERROR", "0")) or None
+# Файл метрик этапов в текстовом формате Prometheus для сборщика (пустой путь — не писать)
+# и как часто он перезаписывается, в секундах
+METRICS_PATH = os.getenv("METRICS_PATH", "metrics/frauds.prom")
+METRICS_INTERVAL = int(os.getenv("METRICS_INTERVAL", "60"))
+# Сколько последних замеров каждого этапа хранится для /stats
+METRICS_SAMPLES = int(os.getenv("METRICS_SAMPLES", "500"))
+# Куда пишется cProfile файла после /profile
+PROFILE_DIR = os.getenv("PROFILE_DIR", "temp/profiles")
+# Кольца по общим картам, IP и именам во всех файлах батча (frauds.rings):
+# минимум email в кольце (0 — не искать) и с какого числа email сущность — общее место
+RING_MIN_EMAILS = int(os.getenv("RING_MIN_EMAILS", "3"))
+RING_MAX_ENTITY_EMAILS = int(os.getenv("RING_MAX_ENTITY_EMAILS", "50"))
+# Формат результатов по умолчанию (frauds.delivery: csv, gz, parquet, top) и сколько
+# строк рейтинга присылать текстом в формате top. Аналитик меняет формат командой /format
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "csv")
+RESULT_TOP_ROWS = int(os.getenv("RESULT_TOP_ROWS", "20"))
+# Уборка temp/ (frauds.janitor): файлы старше TEMP_MAX_AGE_HOURS и самые старые сверх
+# TEMP_QUOTA_MB (0 — без ограничения), раз в TEMP_SWEEP_INTERVAL секунд (0 — не убирать)
+TEMP_MAX_AGE_HOURS = float(os.getenv("TEMP_MAX_AGE_HOURS", "24"))
+TEMP_QUOTA_MB = int(os.getenv("TEMP_QUOTA_MB", "5120"))
+TEMP_SWEEP_INTERVAL = int(os.getenv("TEMP_SWEEP_INTERVAL", "600"))
 
 user_sessions = {}
+# Формат результатов, выбранный командой /format
+user_formats = {}
+# Фоновый разбор загруженных файлов: путь -> задача (см. handle_document)
+preparse_tasks = {}
+# Готовые промежуточные файлы разбора: путь выгрузки -> файлы. Удаляются, как только
+# выгрузка не нужна ни сессии, ни очереди (prune_intermediates)
+intermediates = {}
+# Общий лимит процессов расчета (MAX_RUNNING_JOBS) для пула и очереди
+process_slots = asyncio.Semaphore(MAX_RUNNING_JOBS)
+scoring = ScoringExecutor(max_workers=SCORING_WORKERS, shared_slots=process_slots)
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MB * 1024 * 1024) if RESULT_CACHE_MB else None
+if FEATURE_STORE_PATH:
+    # frauds.store импортирует pandas, поэтому только со включенным хранилищем
+    from frauds.store import FeatureStore
+    feature_store = FeatureStore(FEATURE_STORE_PATH, FEATURE_STORE_WINDOW_DAYS)
+else:
+    feature_store = None
+# Батчи, по которым уже отправлен итог (несколько файлов могут закончиться одновременно),
+# и сколько job_update по батчу еще идет: когда ни одного, батч из finished_batches убирается
+finished_batches = set()
+batch_updates = defaultdict(int)
+# Время, строки и память по этапам последних файлов (см. /stats)
+stage_stats = StageStats(METRICS_SAMPLES)
+# Следующий запущенный файл считается под cProfile (см. /profile)
+profile_next = False
+metrics_task = None
+janitor_task = None
+
+def profile_path(task):
+    return os.path.join(PROFILE_DIR, f"task_{task['id']}.prof")
 
-def calculate_percentiles_and_median(series):
-    return {'95th_percentile': series.quantile(0.95),
-            'median': series.median()
-           }
+def job_args(task):
+    global profile_next
+    path = task['path']
+    profile = None
+    if profile_next:
+        profile_next = False
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile = profile_path(task)
+    # Воркер сразу готовит документ в формате пользователя (см. job_update)
+    return (path, f"temp/{task['user_id']}", scoring_chunksize(path), result_cache, feature_store,
+            APPROX_DISTINCT_ERROR, profile, result_format(task['user_id']), RESULT_TOP_ROWS)
+
+job_queue = JobQueue(JOBS_DB)
+job_runner = JobRunner(job_queue, score_job, job_args, MAX_RUNNING_JOBS, preload=["frauds.warmup"],
+                       slots=process_slots)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("👋 Привет! Используй /batch, чтобы загрузить файлы. Потом — /done.")
 
 async def batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
+    # Файлы прошлой сессии без /done считаться не будут
+    drop_preparses(user_sessions.get(user_id, []), cancel=True)
     user_sessions[user_id] = []
+    prune_intermediates()
     os.makedirs(f"temp/{user_id}", exist_ok=True)
     await update.message.reply_text("📥 Жду загрузку CSV-файлов. Когда закончишь — напиши /done.")
 
+def preparse_finished(path, task):
+    # Ошибку разбора покажет сам расчет; здесь она только забирается у задачи
+    if task.cancelled() or task.exception() is not None or task.result() is None:
+        return
+    intermediates.setdefault(path, set()).add(task.result())
+    # Расчет мог закончиться раньше разбора
+    prune_intermediates()
+
+def prune_intermediates():
+    # Промежуточные файлы выгрузок, которые уже не ждут ни /done, ни очередь
+    in_use = {path for files in user_sessions.values() for path in files} | set(job_queue.active_paths())
+    for path in [path for path in intermediates if path not in in_use]:
+        for intermediate in intermediates.pop(path):
+            try:
+                os.remove(intermediate)
+            except FileNotFoundError:
+                pass
+
+def drop_preparses(paths, cancel=False):
+    # Разбор файлов больше не отслеживается; с cancel он еще и отменяется,
+    # если не успел дойти до воркера
+    for path in paths:
+        task = preparse_tasks.pop(path, None)
+        if task is not None and cancel:
+            task.cancel()
+
+def needs_preparse(path):
+    # Разбор заранее полезен только для файлов, которые читаются целиком
+    return scoring_chunksize(path) is None and feature_store is None
+
+def scoring_chunksize(path):
+    # Большие выгрузки не читаем целиком, иначе контейнер упирается в память
+    return streaming_chunksize(path, STREAMING_THRESHOLD_MB, STREAMING_CHUNK_ROWS)
+
 async def done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    file_list = user_sessions.get(user_id, [])
+    # Сессия забирается сразу: апдейты обрабатываются параллельно, и файл, загруженный
+    # во время /done, иначе попал бы в список уже после отправки батча и потерялся
+    file_list = user_sessions.pop(user_id, [])
 
     if not file_list:
         await update.message.reply_text("😕 Ты не загрузил ни одного файла.")
         return
 
-    await update.message.reply_text("🔍 Обрабатываю файлы по отдельности...")
-
+    # Разбор, запущенный при загрузке, не ждем: расчет возьмет готовый промежуточный
+    # файл, а если разбор еще идет — прочитает CSV сам (frauds.ingest.load_export)
+    drop_preparses(file_list)
     try:
-        for path in file_list:
-            filename = os.path.basename(path)
-
-            # Назначаем имя датафрейма
-            if filename.lower().startswith("transaction"):
-                df_name = "df_upgate"
-            elif re.match(r"^\d{8}_\d{6}", filename):
-                df_name = "df_unlimit"
-            elif filename.lower().startswith("report"):
-                df_name = "df_payabl"
-            elif filename.lower().startswith("export"):
-                df_name = "df_centrobill"
-            else:
-                df_name = "df_unknown"
-
-            # Специальная обработка для df_upgate
-            if df_name == "df_upgate":
-                df = pd.read_csv(path)
-                upgate = df.copy() 
-                upgate = upgate.dropna(subset=['id']).copy()
-                upgate['createdAt'] = pd.to_datetime(upgate['createdAt'], errors='coerce', utc=True)
-                upgate['payment.createdAt'] = pd.to_datetime(upgate['payment.createdAt'], errors='coerce', utc=True)
-                # 1. Поиск массовых попыток платежей с одного Email
-                df_ip_counts_upgate = upgate.groupby('payment.email')['operationId'].nunique()
-                upgate['email_operation_count'] = upgate['payment.email'].map(df_ip_counts_upgate)
-                
-                # 2. Несоответствие страны платежа и IP-адреса (исключая NaN)
-                upgate['geo_mismatch'] = (upgate['payment.countryCode'].notna() & upgate['paymentContext.IP_COUNTRY_CODE'].notna() & 
-                                      (upgate['payment.countryCode'] != upgate['paymentContext.IP_COUNTRY_CODE']))
-                
-                # 3. Подсчет количества разных email для одной карты
-                card_bin_email_counts_upgate = upgate.groupby(['paymentDetails.CARD_BIN', 'paymentDetails.CARD_LAST_FOUR_DIGITS'])['payment.email'].nunique()
-                upgate['card_used_by_different_emails'] = upgate.set_index(['paymentDetails.CARD_BIN', 'paymentDetails.CARD_LAST_FOUR_DIGITS']).index.map(card_bin_email_counts_upgate)
-                
-                # 4. Подсчет количества разных карт для одного email
-                df_email_card_counts_upgate = upgate.groupby('payment.email')['paymentDetails.CARD_LAST_FOUR_DIGITS'].nunique()
-                upgate['different_cards_per_email'] = upgate['payment.email'].map(df_email_card_counts_upgate)
-                
-                # 5. Несоответствие User-Agent у одного аккаунта
-                df_ua_counts_upgate = upgate.groupby('payment.email')['paymentContext.BROWSER_USER_AGENT'].nunique()
-                upgate['ua_variety'] = upgate['payment.email'].map(df_ua_counts_upgate)
-                
-                # 6. Подозрительные попытки 3DS-аутентификации
-                failed_3ds_upgate = upgate[upgate["transactionDetails.THREE_DS_STATUS"].isin(["N", "R", "U"])]
-                
-                failed_3ds_email_counts_upgate = failed_3ds_upgate["payment.email"].value_counts()
-                upgate["failed_3ds_per_email"] = upgate["payment.email"].map(failed_3ds_email_counts_upgate).fillna(0).astype(int)
-                
-                failed_3ds_ip_counts_upgate = failed_3ds_upgate["paymentContext.IP"].value_counts()
-                upgate["failed_3ds_per_ip"] = upgate["paymentContext.IP"].map(failed_3ds_ip_counts_upgate).fillna(0).astype(int)
-                
-                # 7. Мультиаккаунтинг (один IP на много аккаунтов)
-                df_multiacc_upgate = upgate.groupby('paymentContext.IP')['payment.email'].nunique()
-                upgate['multiacc'] = upgate['paymentContext.IP'].map(df_multiacc_upgate)
-                
-                # 8. Количество уникальных BIN на email
-                upgate["paymentDetails.CARD_BIN"] = upgate["paymentDetails.CARD_BIN"].astype(str)
-                bin_per_email_upgate = upgate.groupby("payment.email")["paymentDetails.CARD_BIN"].nunique()
-                upgate["unique_bins_per_email"] = upgate["payment.email"].map(bin_per_email_upgate).fillna(0).astype(int)
-                
-                # 9. Количество уникальных имен владельцев карт на email
-                names_per_email_upgate = upgate.groupby("payment.email")["cardData.cardFullName"].nunique()
-                upgate["unique_card_names_per_email"] = upgate["payment.email"].map(names_per_email_upgate).fillna(0).astype(int)
-                
-                # 10. Количество email на одного владельца карты
-                emails_per_card_name_upgate = upgate.groupby("cardData.cardFullName")["payment.email"].nunique()
-                upgate["unique_emails_per_card_name"] = upgate["cardData.cardFullName"].map(emails_per_card_name_upgate).fillna(0).astype(int)
-                
-                # 11. Выявление неестественно больших сумм
-                upgate['large_payment'] = upgate['payment.amount'] > upgate['payment.amount'].quantile(0.95)
-                
-                # 12. Подсчет успешных и неуспешных транзакций
-                successful_transactions_upgate = upgate[(upgate['transactionType'] == 'SALE') & (upgate['responseCodeStatus'] == 'SUCCESS')]
-                unsuccessful_transactions_upgate = upgate[(upgate['transactionType'] == 'SALE') & (upgate['responseCodeStatus'] == 'DECLINE')]
-                fraud_related_transactions_upgate = upgate[upgate['transactionType'].isin(['FRAUD_ALERT', 'CHARGEBACK'])]
-                
-                # 13. Учет fraud_related_transactions
-                fraud_transactions_count_upgate = fraud_related_transactions_upgate.groupby('payment.email').size()
-                upgate['fraud_transactions_count'] = upgate['payment.email'].map(fraud_transactions_count_upgate).fillna(0)
-                
-                # 14. Расчет отношения неуспешных транзакций к успешным
-                failure_ratio_upgate = unsuccessful_transactions_upgate.groupby('payment.email').size() / successful_transactions_upgate.groupby('payment.email').size()
-                upgate['failure_ratio'] = upgate['payment.email'].map(failure_ratio_upgate).fillna(0)
-                
-                stats_dict_upgate = {col: calculate_percentiles_and_median(upgate[col]) for col in [
-                    'email_operation_count', 
-                    'card_used_by_different_emails', 
-                    'different_cards_per_email', 
-                    'ua_variety',
-                    'failed_3ds_per_email', 
-                    'multiacc', 
-                    'unique_bins_per_email',
-                    'unique_card_names_per_email', 
-                    'unique_emails_per_card_name', 
-                    'failure_ratio', 
-                    'fraud_transactions_count'
-                ]}
-                
-                stats_upgate = pd.DataFrame(stats_dict_upgate).T
-                
-                # Применение порогов
-                df_stats_upgate = upgate.copy()
-                for col in stats_dict_upgate.keys():
-                    threshold_upgate = stats_upgate.loc[col, '95th_percentile']
-                    df_stats_upgate[f'is_fraud_{col}'] = df_stats_upgate[col] > threshold_upgate
-                
-                # Флаг для geo_mismatch
-                df_stats_upgate['is_fraud_geo_mismatch'] = df_stats_upgate['geo_mismatch']
-                
-                # Флаг для больших сумм
-                df_stats_upgate['is_fraud_large_payment'] = df_stats_upgate['large_payment']
-                
-                weights_upgate = {
-                    'is_fraud_failed_3ds_per_email': 0.25,
-                    'is_fraud_email_operation_count': 0.1,
-                    'is_fraud_different_cards_per_email': 0.7,
-                    'is_fraud_card_used_by_different_emails': 0.25,
-                    'is_fraud_geo_mismatch': 0.1,
-                    'is_fraud_ua_variety': 0.15,
-                    'is_fraud_unique_bins_per_email': 0.25,
-                    'is_fraud_unique_card_names_per_email': 0.2,
-                    'is_fraud_unique_emails_per_card_name': 0.25,
-                    'is_fraud_large_payment': 0.1,
-                    'is_fraud_failure_ratio': 0.15,
-                    'is_fraud_fraud_transactions_count': 1
-                }
-                
-                # Рассчитываем суммарный вес
-                total_weight_upgate = sum(weights_upgate.values())
-                
-                # Группировка по email для вычисления суммарных флагов
-                df_unique_emails_upgate = df_stats_upgate.drop_duplicates(subset='payment.email')
-                df_user_stats_upgate = df_unique_emails_upgate.groupby('payment.email')[list(weights_upgate.keys())].sum()
-                
-                # Подсчет итогового fraud_score с нормализацией
-                for col, weight in weights_upgate.items():
-                    df_user_stats_upgate[col] *= weight
-                
-                df_user_stats_upgate['fraud_score_upgate'] = df_user_stats_upgate[list(weights_upgate.keys())].sum(axis=1)
-                
-                # Сортировка по fraud_score
-                fraud_users_sorted_upgate = df_user_stats_upgate.sort_values(by='fraud_score_upgate', ascending=False)
-
-                fraud_users_sorted_upgate = fraud_users_sorted_upgate.reset_index()
-                
-                # Выводим результат
-                df = fraud_users_sorted_upgate[['payment.email', 'fraud_score_upgate']].copy()
-                
-            elif df_name == "df_unlimit":
-                df = pd.read_csv(path, sep=";")
-                
-                unlimit = df.copy()
-                
-                unlimit = unlimit[unlimit['Card type'] != 'ewallet'].copy()
-
-                # 1. Поиск массовых попыток платежей с одного Email
-                df_ip_counts_unlimit = unlimit.groupby('Email')['Payment ID'].nunique()
-                unlimit['email_operation_count'] = unlimit['Email'].map(df_ip_counts_unlimit)
-                
-                # 2. Несоответствие страны платежа и IP-адреса (исключая NaN)
-                unlimit['geo_mismatch'] = (unlimit['IP country'].notna() & unlimit['Card country'].notna() & 
-                                      (unlimit['IP country'] != unlimit['Card country']))
-                
-                # 3. Подсчет количества разных email для одной карты
-                unlimit['CARD_BIN'] = unlimit['Card number'].str[:6]
-                unlimit['LAST_FOUR'] = unlimit['Card number'].str[-4:]
-                card_bin_email_counts_unlimit = unlimit.groupby(['CARD_BIN', 'LAST_FOUR'])['Email'].nunique()
-                unlimit['card_used_by_different_emails'] = unlimit.set_index(['CARD_BIN', 'LAST_FOUR']).index.map(card_bin_email_counts_unlimit)
-                
-                # 4. Подсчет количества разных карт для одного email
-                df_email_card_counts_unlimit = unlimit.groupby('Email')['LAST_FOUR'].nunique()
-                unlimit['different_cards_per_email'] = unlimit['Email'].map(df_email_card_counts_unlimit)
-                
-                # 5. Мультиаккаунтинг (один IP на много аккаунтов)
-                df_multiacc_unlimit = unlimit.groupby('Customer IP')['Email'].nunique()
-                unlimit['multiacc'] = unlimit['Customer IP'].map(df_multiacc_unlimit)
-                
-                # 6. Количество уникальных BIN на email
-                bin_per_email_unlimit = unlimit.groupby("Email")["CARD_BIN"].nunique()
-                unlimit["unique_bins_per_email"] = unlimit["Email"].map(bin_per_email_unlimit).fillna(0).astype(int)
-                
-                # 7. Количество уникальных имен владельцев карт на email
-                names_per_email_unlimit = unlimit.groupby("Email")["Card Holder"].nunique()
-                unlimit["unique_card_names_per_email"] = unlimit["Email"].map(names_per_email_unlimit).fillna(0).astype(int)
-                
-                # 8. Количество email на одного владельца карты
-                emails_per_card_name_unlimit = unlimit.groupby("Card Holder")["Email"].nunique()
-                unlimit["unique_emails_per_card_name"] = unlimit["Card Holder"].map(emails_per_card_name_unlimit).fillna(0).astype(int)
-                
-                # 9. Выявление неестественно больших сумм
-                unlimit['large_payment'] = unlimit['Amount'] > unlimit['Amount'].quantile(0.95)
-                
-                # 10. Подсчет успешных и неуспешных транзакций
-                successful_transactions_unlimit = unlimit[(unlimit['Order type'] == 'Payment') & (unlimit['Status'] == 'Captured')]
-                unsuccessful_transactions_unlimit = unlimit[(unlimit['Order type'] == 'Payment') & (unlimit['Status'] == 'Declined')]
-                fraud_related_transactions_unlimit = unlimit[unlimit['Status'].isin(['Chargeback'])]
-                
-                # 11. Учет fraud_related_transactions
-                fraud_transactions_count_unlimit = fraud_related_transactions_unlimit.groupby('Email').size()
-                unlimit['fraud_transactions_count'] = unlimit['Email'].map(fraud_transactions_count_unlimit).fillna(0)
-                
-                # 12. Расчет отношения неуспешных транзакций к успешным
-                failure_ratio_unlimit = unsuccessful_transactions_unlimit.groupby('Email').size() / successful_transactions_unlimit.groupby('Email').size()
-                unlimit['failure_ratio'] = unlimit['Email'].map(failure_ratio_unlimit).fillna(0)
-                
-                stats_dict_unlimit = {col: calculate_percentiles_and_median(unlimit[col]) for col in [
-                    'email_operation_count', 
-                    'card_used_by_different_emails', 
-                    'different_cards_per_email', 
-                    'multiacc', 
-                    'unique_bins_per_email',
-                    'unique_card_names_per_email', 
-                    'unique_emails_per_card_name', 
-                    'failure_ratio', 
-                    'fraud_transactions_count'
-                ]}
-                
-                stats_df_unlimit = pd.DataFrame(stats_dict_unlimit).T
-                
-                # Применение порогов
-                df_stats_unlimit = unlimit.copy()
-                for col in stats_dict_unlimit.keys():
-                    threshold_unlimit = stats_df_unlimit.loc[col, '95th_percentile']
-                    df_stats_unlimit[f'is_fraud_{col}'] = df_stats_unlimit[col] > threshold_unlimit
-                
-                # Флаг для geo_mismatch
-                df_stats_unlimit['is_fraud_geo_mismatch'] = df_stats_unlimit['geo_mismatch']
-                
-                # Флаг для больших сумм
-                df_stats_unlimit['is_fraud_large_payment'] = df_stats_unlimit['large_payment']
-                
-                weights_unlimit = {
-                    'is_fraud_email_operation_count': 0.1,
-                    'is_fraud_different_cards_per_email': 0.25,
-                    'is_fraud_card_used_by_different_emails': 0.25,
-                    'is_fraud_geo_mismatch': 0.1,
-                    'is_fraud_unique_bins_per_email': 0.25,
-                    'is_fraud_unique_card_names_per_email': 0.2,
-                    'is_fraud_unique_emails_per_card_name': 0.25,
-                    'is_fraud_large_payment': 0.1,
-                    'is_fraud_failure_ratio': 0.15,
-                    'is_fraud_fraud_transactions_count': 1
-                }
-                
-                # Рассчитываем суммарный вес
-                total_weight_unlimit = sum(weights_unlimit.values())
-                
-                # Группировка по email для вычисления суммарных флагов
-                df_unique_emails_unlimit = df_stats_unlimit.drop_duplicates(subset='Email')
-                df_user_stats_unlimit = df_unique_emails_unlimit.groupby('Email')[list(weights_unlimit.keys())].sum()
-                
-                # Подсчет итогового fraud_score с нормализацией
-                for col, weight in weights_unlimit.items():
-                    df_user_stats_unlimit[col] *= weight
-                
-                df_user_stats_unlimit['fraud_score_unlimit'] = df_user_stats_unlimit[list(weights_unlimit.keys())].sum(axis=1)
-                
-                # Сортировка по fraud_score
-                fraud_users_sorted_unlimit = df_user_stats_unlimit.sort_values(by='fraud_score_unlimit', ascending=False)
-                
-                fraud_users_sorted_unlimit = fraud_users_sorted_unlimit.reset_index()
-                # Выводим результат
-                df = fraud_users_sorted_unlimit[['Email', 'fraud_score_unlimit']].copy()
-            elif df_name == "df_payabl":
-                df = pd.read_csv(path)
-                payabl = df.copy()
-                # 1. Поиск массовых попыток платежей с одного Email
-                df_ip_counts_payabl = payabl.groupby('EMail')['Order No.'].nunique()
-                payabl['email_operation_count'] = payabl['EMail'].map(df_ip_counts_payabl)
-                
-                # 2. Несоответствие страны платежа и IP-адреса (исключая NaN)
-                payabl['geo_mismatch'] = (payabl['Bin Country'] != payabl['IP Country'])
-                
-                # 3. Подсчет количества разных email для одной карты
-                payabl['last_four'] = payabl['Credit Card Number'].str[-4:]
-                card_bin_email_counts_payabl = payabl.groupby(['Credit Card Bin', 'last_four'])['EMail'].nunique()
-                payabl['card_used_by_different_emails'] = payabl.set_index(['Credit Card Bin', 'last_four']).index.map(card_bin_email_counts_payabl)
-                
-                # 4. Подсчет количества разных карт для одного email
-                df_email_card_counts_payabl = payabl.groupby('EMail')['last_four'].nunique()
-                payabl['different_cards_per_email'] = payabl['EMail'].map(df_email_card_counts_payabl)
-                
-                # 5. Мультиаккаунтинг (один IP на много аккаунтов)
-                df_multiacc_payabl = payabl.groupby('Customer-IP')['EMail'].nunique()
-                payabl['multiacc'] = payabl['Customer-IP'].map(df_multiacc_payabl)
-                
-                # 6. Количество уникальных BIN на email
-                bin_per_email_payabl = payabl.groupby("EMail")["Credit Card Bin"].nunique()
-                payabl["unique_bins_per_email"] = payabl["EMail"].map(bin_per_email_payabl).fillna(0).astype(int)
-                
-                # 7. Количество уникальных имен владельцев карт на email
-                names_per_email_payabl = payabl.groupby("EMail")["Credit Cardholder"].nunique()
-                payabl["unique_card_names_per_email"] = payabl["EMail"].map(names_per_email_payabl).fillna(0).astype(int)
-                
-                # 8. Количество email на одного владельца карты
-                emails_per_card_name_payabl = payabl.groupby("Credit Cardholder")["EMail"].nunique()
-                payabl["unique_emails_per_card_name"] = payabl["Credit Cardholder"].map(emails_per_card_name_payabl).fillna(0).astype(int)
-                
-                # 9. Выявление неестественно больших сумм
-                payabl['large_payment'] = payabl['Amount'] > payabl['Amount'].quantile(0.95)
-                
-                # 10. Подсчет успешных и неуспешных транзакций
-                successful_transactions_payabl = payabl[(payabl['Tx-Type'] == 'Authorisation') & (payabl['Status'] == 'Successful')]
-                unsuccessful_transactions_payabl = payabl[(payabl['Tx-Type'] == 'Authorisation') & (payabl['Status'] == 'Failed')]
-                fraud_related_transactions_payabl = payabl[payabl['Tx-Type'].isin(['Chargeback'])]
-                
-                # 11. Учет fraud_related_transactions
-                fraud_transactions_count_payabl = fraud_related_transactions_payabl.groupby('EMail').size()
-                payabl['fraud_transactions_count'] = payabl['EMail'].map(fraud_transactions_count_payabl).fillna(0)
-                
-                # 12. Расчет отношения неуспешных транзакций к успешным
-                failure_ratio_payabl = unsuccessful_transactions_payabl.groupby('EMail').size() / successful_transactions_payabl.groupby('EMail').size()
-                payabl['failure_ratio'] = payabl['EMail'].map(failure_ratio_payabl).fillna(0)
-                
-                stats_dict_payabl = {col: calculate_percentiles_and_median(payabl[col]) for col in [
-                    'email_operation_count', 
-                    'card_used_by_different_emails', 
-                    'different_cards_per_email', 
-                    'multiacc', 
-                    'unique_bins_per_email',
-                    'unique_card_names_per_email', 
-                    'unique_emails_per_card_name', 
-                    'failure_ratio', 
-                    'fraud_transactions_count'
-                ]}
-                
-                stats_df_payabl = pd.DataFrame(stats_dict_payabl).T
-                
-                # Применение порогов
-                df_stats_payabl = payabl.copy()
-                for col in stats_dict_payabl.keys():
-                    threshold_payabl = stats_df_payabl.loc[col, '95th_percentile']
-                    df_stats_payabl[f'is_fraud_{col}'] = df_stats_payabl[col] > threshold_payabl
-                
-                # Флаг для geo_mismatch
-                df_stats_payabl['is_fraud_geo_mismatch'] = df_stats_payabl['geo_mismatch']
-                
-                # Флаг для больших сумм
-                df_stats_payabl['is_fraud_large_payment'] = df_stats_payabl['large_payment']
-                
-                weights_payabl = {
-                    'is_fraud_email_operation_count': 0.1,
-                    'is_fraud_different_cards_per_email': 0.25,
-                    'is_fraud_card_used_by_different_emails': 0.25,
-                    'is_fraud_geo_mismatch': 0.1,
-                    'is_fraud_unique_bins_per_email': 0.25,
-                    'is_fraud_unique_card_names_per_email': 0.2,
-                    'is_fraud_unique_emails_per_card_name': 0.25,
-                    'is_fraud_large_payment': 0.1,
-                    'is_fraud_failure_ratio': 0.15,
-                    'is_fraud_fraud_transactions_count': 1
-                }
-                
-                # Рассчитываем суммарный вес
-                total_weight_payabl = sum(weights_payabl.values())
-                
-                # Группировка по email для вычисления суммарных флагов
-                df_unique_emails_payabl = df_stats_payabl.drop_duplicates(subset='EMail')
-                df_user_stats_payabl = df_unique_emails_payabl.groupby('EMail')[list(weights_payabl.keys())].sum()
-                
-                # Подсчет итогового fraud_score с нормализацией
-                for col, weight in weights_payabl.items():
-                    df_user_stats_payabl[col] *= weight
-                
-                df_user_stats_payabl['fraud_score_payabl'] = df_user_stats_payabl[list(weights_payabl.keys())].sum(axis=1)
-                
-                # Сортировка по fraud_score
-                fraud_users_sorted_payabl = df_user_stats_payabl.sort_values(by='fraud_score_payabl', ascending=False)
-
-                fraud_users_sorted_payabl = fraud_users_sorted_payabl.reset_index()
-                
-                df = fraud_users_sorted_payabl[['EMail', 'fraud_score_payabl']].copy()
-
-            elif df_name == "df_centrobill":
-                df = pd.read_csv(path, sep=";")
-                
-                centrobill = df.copy()
-                
-                centrobill = centrobill[centrobill['Payment method'].isin(['visa', 'mastercard'])].copy()
-
-                centrobill = centrobill[centrobill['Test'] == 'no'].copy()
-                
-                # 1. Поиск массовых попыток платежей с одного Email
-                df_ip_counts_centrobill = centrobill.groupby('E-mail')['Transaction ID'].nunique()
-                centrobill['email_operation_count'] = centrobill['E-mail'].map(df_ip_counts_centrobill)
-                
-                # 2. Подсчет количества разных email для одной карты
-                card_bin_email_counts_centrobill = centrobill.groupby(['Bin', 'Last four'])['E-mail'].nunique()
-                centrobill['card_used_by_different_emails'] = centrobill.set_index(['Bin', 'Last four']).index.map(card_bin_email_counts_centrobill)
-                
-                # 3. Подсчет количества разных карт для одного email
-                df_email_card_counts_centrobill = centrobill.groupby('E-mail')['Last four'].nunique()
-                centrobill['different_cards_per_email'] = centrobill['E-mail'].map(df_email_card_counts_centrobill)
-                
-                # 4. Количество уникальных BIN на email
-                centrobill["Bin"] = centrobill["Bin"].astype(str)
-                centrobill['Bin'] = centrobill['Bin'].str[:6]
-                bin_per_email_centrobill = centrobill.groupby("E-mail")["Bin"].nunique()
-                centrobill["unique_bins_per_email"] = centrobill["E-mail"].map(bin_per_email_centrobill).fillna(0).astype(int)
-                
-                # 5. Количество уникальных имен владельцев карт на email
-                names_per_email_centrobill = centrobill.groupby("E-mail")["Customer name"].nunique()
-                centrobill["unique_card_names_per_email"] = centrobill["E-mail"].map(names_per_email_centrobill).fillna(0).astype(int)
-                
-                # 6. Количество email на одного владельца карты
-                emails_per_card_name_centrobill = centrobill.groupby("Customer name")["E-mail"].nunique()
-                centrobill["unique_emails_per_card_name"] = centrobill["Customer name"].map(emails_per_card_name_centrobill).fillna(0).astype(int)
-                
-                # 7. Выявление неестественно больших сумм
-                centrobill['large_payment'] = centrobill['USD Cost'] > centrobill['USD Cost'].quantile(0.95)
-                
-                # 8. Подсчет успешных и неуспешных транзакций
-                successful_transactions_centrobill = centrobill[(centrobill['Type'].isin(['Initial', 'Non-Recurring', 'Recurring'])) & (centrobill['Status'] == 'success')]
-                unsuccessful_transactions_centrobill = centrobill[(centrobill['Type'].isin(['Initial', 'Non-Recurring', 'Recurring'])) & (centrobill['Status'] == 'fail')]
-                fraud_related_transactions_centrobill = centrobill[centrobill['Type'].isin(['Chargeback'])]
-                
-                # 9. Учет fraud_related_transactions
-                fraud_transactions_count_centrobill = fraud_related_transactions_centrobill.groupby('E-mail').size()
-                centrobill['fraud_transactions_count'] = centrobill['E-mail'].map(fraud_transactions_count_centrobill).fillna(0)
-                
-                # 10. Расчет отношения неуспешных транзакций к успешным
-                failure_ratio_centrobill = unsuccessful_transactions_centrobill.groupby('E-mail').size() / successful_transactions_centrobill.groupby('E-mail').size()
-                centrobill['failure_ratio'] = centrobill['E-mail'].map(failure_ratio_centrobill).fillna(0)
-                
-                stats_dict_centrobill = {col: calculate_percentiles_and_median(centrobill[col]) for col in [
-                    'email_operation_count', 
-                    'card_used_by_different_emails', 
-                    'different_cards_per_email', 
-                    'unique_bins_per_email',
-                    'unique_card_names_per_email', 
-                    'unique_emails_per_card_name', 
-                    'failure_ratio', 
-                    'fraud_transactions_count'
-                ]}
-                
-                stats_df_centrobill = pd.DataFrame(stats_dict_centrobill).T
-                
-                # Применение порогов
-                df_stats_centrobill = centrobill.copy()
-                for col in stats_dict_centrobill.keys():
-                    threshold_centrobill = stats_df_centrobill.loc[col, '95th_percentile']
-                    df_stats_centrobill[f'is_fraud_{col}'] = df_stats_centrobill[col] > threshold_centrobill
-                
-                # Флаг для больших сумм
-                df_stats_centrobill['is_fraud_large_payment'] = df_stats_centrobill['large_payment']
-                
-                weights_centrobill = {
-                    'is_fraud_email_operation_count': 0.1,
-                    'is_fraud_different_cards_per_email': 0.25,
-                    'is_fraud_card_used_by_different_emails': 0.25,
-                    'is_fraud_unique_bins_per_email': 0.25,
-                    'is_fraud_unique_card_names_per_email': 0.2,
-                    'is_fraud_unique_emails_per_card_name': 0.25,
-                    'is_fraud_large_payment': 0.1,
-                    'is_fraud_failure_ratio': 0.15,
-                    'is_fraud_fraud_transactions_count': 0.5
-                }
-                
-                # Рассчитываем суммарный вес
-                total_weight_centrobill = sum(weights_centrobill.values())
-                
-                # Группировка по email для вычисления суммарных флагов
-                df_unique_emails_centrobill = df_stats_centrobill.drop_duplicates(subset='E-mail')
-                
-                df_user_stats_centrobill = df_unique_emails_centrobill.groupby('E-mail')[list(weights_centrobill.keys())].sum()
-                
-                # Подсчет итогового fraud_score с нормализацией
-                for col, weight in weights_centrobill.items():
-                    df_user_stats_centrobill[col] *= weight
-                
-                df_user_stats_centrobill['fraud_score_centrobill'] = df_user_stats_centrobill[list(weights_centrobill.keys())].sum(axis=1) / total_weight_centrobill
-                
-                # Сортировка по fraud_score
-                fraud_users_sorted_centrobill = df_user_stats_centrobill.sort_values(by='fraud_score_centrobill', ascending=False)
-                
-                fraud_users_sorted_centrobill = fraud_users_sorted_centrobill.reset_index()
-                
-                df = fraud_users_sorted_centrobill[['E-mail', 'fraud_score_centrobill']].copy()
-            else:
-                # Пример добавки source метки для остальных (можно убрать)
-                df['source'] = df_name
-            # Сохраняем результат
-            result_path = f"temp/{user_id}/result_{df_name}_{filename}"
-            df.to_csv(result_path, index=False)
-            await update.message.reply_document(document=open(result_path, "rb"))
-        
-        await update.message.reply_text("✅ Все файлы обработаны и отправлены.")
+        # Файлы уходят в очередь, бот сразу свободен. Результаты присылает job_update
+        batch_id = job_queue.submit(user_id, update.effective_chat.id, file_list)
+        message = await update.message.reply_text(
+            f"🔍 Файлов в очереди: {len(file_list)}. Присылаю по мере готовности, /cancel — отменить."
+        )
+        job_queue.set_message(batch_id, message.message_id)
+        job_runner.notify()
     except Exception as e:
         await update.message.reply_text(f"⚠️ Ошибка: {e}")
+
+def result_format(user_id):
+    return user_formats.get(user_id, RESULT_FORMAT)
+
+async def send_rendered(bot, chat_id, rendered, caption=None, title=None):
+    # rendered — (имя файла, байты) или (None, текст) для формата top
+    filename, payload = rendered
+    if filename is not None:
+        await bot.send_document(chat_id, document=payload, filename=filename, caption=caption)
+        return
+    text = "\n".join(line for line in (title, caption, payload) if line)
+    await bot.send_message(chat_id, text[:MESSAGE_LIMIT])
+
+def provider_name(path):
+    spec = detect_provider(export_name(path))
+    return spec.name if spec else None
+
+def progress_text(progress, task=None):
+    finished = progress[DONE] + progress[FAILED] + progress[CANCELLED]
+    if progress[QUEUED] or progress[RUNNING]:
+        text = f"⏳ {finished}/{progress['total']} файлов"
+        if task is not None:
+            text += f", {provider_name(task['path']) or export_name(task['path'])}: расчет"
+        return text
+    if progress[CANCELLED]:
+        return f"🛑 Отменено. Обработано {progress[DONE]} из {progress['total']} файлов."
+    if progress[FAILED]:
+        return f"⚠️ Обработано {progress[DONE]} из {progress['total']} файлов."
+    return "✅ Все файлы обработаны и отправлены."
+
+async def job_update(bot, batch_id, task, event, rendered=None):
+    # Вызывается JobRunner: отправка результата файла и прогресс батча в одном сообщении.
+    # rendered — документ, готовый в воркере (score_job); на диске остается только матрица признаков
+    batch_updates[batch_id] += 1
+    try:
+        await update_batch(bot, batch_id, task, event, rendered)
     finally:
-        user_sessions.pop(user_id, None)
+        batch_updates[batch_id] -= 1
+        if not batch_updates[batch_id]:
+            del batch_updates[batch_id]
+            finished_batches.discard(batch_id)
+
+async def update_batch(bot, batch_id, task, event, rendered):
+    batch = job_queue.batch(batch_id)
+    chat_id = batch['chat_id']
+    # Файл посчитан или снят с очереди: разобранная заранее копия больше не нужна
+    prune_intermediates()
+    if event == 'finished':
+        filename = export_name(task['path'])
+        error = task['error']
+        if task['status'] == DONE:
+            _, cached, stages = json.loads(task['result'])
+            provider = provider_name(task['path'])
+            stage_stats.record_job(provider, stages)
+            caption = "♻️ Этот файл уже обрабатывался, результат взят из кэша." if cached else None
+            try:
+                started = time.perf_counter()
+                await send_rendered(bot, chat_id, rendered, caption, title=f"📄 {filename}")
+                stage_stats.record(provider, 'send', time.perf_counter() - started)
+            except Exception as e:
+                error = e
+        if error is not None and task['status'] != CANCELLED:
+            await bot.send_message(chat_id, f"⚠️ Ошибка в файле '{filename}': {error}")
+        if os.path.exists(profile_path(task)):
+            await send_profile(bot, task)
+
+    progress = job_queue.progress(batch_id)
+    text = progress_text(progress, task if event == 'started' else None)
+    if batch['message_id'] is not None:
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=batch['message_id'])
+        except BadRequest:
+            # Текст не изменился или сообщение удалено
+            pass
+    if not (progress[QUEUED] or progress[RUNNING]) and batch_id not in finished_batches:
+        finished_batches.add(batch_id)
+        await bot.send_message(chat_id, text)
+        if RING_MIN_EMAILS and progress[DONE] and not progress[CANCELLED]:
+            # Не задерживаем JobRunner: отчет придет отдельным сообщением
+            asyncio.create_task(send_rings(bot, batch_id))
+
+async def send_rings(bot, batch_id):
+    # Связи между файлами батча: отдельный проход после результатов по файлам
+    batch = job_queue.batch(batch_id)
+    results = [(path, result[0]) for path, result in job_queue.results(batch_id)]
+    try:
+        started = time.perf_counter()
+        count, cross, rendered = await scoring.run(
+            rings_document, results, f"rings_{batch_id}", result_format(batch['user_id']), RESULT_TOP_ROWS,
+            RING_MIN_EMAILS, RING_MAX_ENTITY_EMAILS, STREAMING_THRESHOLD_MB, STREAMING_CHUNK_ROWS,
+        )
+        stage_stats.record('batch', 'rings', time.perf_counter() - started)
+        if count:
+            await send_rendered(bot, batch['chat_id'], rendered,
+                                caption=f"🔗 Колец: {count}, из них в нескольких провайдерах: {cross}")
+    except Exception as e:
+        await bot.send_message(batch['chat_id'], f"⚠️ Не удалось найти кольца между файлами: {e}")
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    drop_preparses(user_sessions.pop(user_id, []), cancel=True)
+    prune_intermediates()
+    count = await job_runner.cancel(user_id)
+    if count:
+        await update.message.reply_text(f"🛑 Отменено файлов: {count}.")
+    else:
+        await update.message.reply_text("😕 Нечего отменять.")
+
+def parse_reweight(args):
+    # ['multiacc=0.5', 'large_payment=0', 'percentile=90'] -> (веса, перцентиль)
+    weights, percentile = {}, 0.95
+    for arg in args:
+        name, sep, value = arg.partition('=')
+        if not sep:
+            raise ValueError(f"ожидалось имя=значение, получено '{arg}'")
+        value = float(value.replace(',', '.'))
+        if name in ('percentile', 'p'):
+            percentile = value / 100 if value > 1 else value
+            if not 0 < percentile <= 1:
+                raise ValueError("перцентиль должен быть от 0 до 100")
+        else:
+            name = name if name.startswith('is_fraud_') else f'is_fraud_{name}'
+            if not any(name in spec.weights for spec in PROVIDERS.values()):
+                raise ValueError(f"неизвестный признак '{name}'")
+            weights[name] = value
+    return weights, percentile
+
+async def reweight(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Пересчет последнего батча по сохраненным матрицам признаков: без чтения выгрузок
+    user_id = update.effective_user.id
+    try:
+        weights, percentile = parse_reweight(context.args)
+    except ValueError as e:
+        await update.message.reply_text(
+            f"⚠️ {e}\nПример: /reweight card_used_by_different_emails=0.5 large_payment=0 percentile=90"
+        )
+        return
+
+    matrices = [(path, result[0]) for path, result in job_queue.last_results(user_id)]
+    matrices = [(path, features_path) for path, features_path in matrices if os.path.exists(features_path)]
+    if not matrices:
+        await update.message.reply_text("😕 Нет посчитанных файлов для пересчета. Сначала /batch и /done.")
+        return
+
+    for path, features_path in matrices:
+        name = f"{os.path.splitext(os.path.basename(features_path))[0]}_reweight"
+        # В батче могут быть разные провайдеры: каждому — только его признаки
+        spec = detect_provider(export_name(path))
+        file_weights = {name: weight for name, weight in weights.items() if name in spec.weights}
+        try:
+            rendered = await scoring.run(reweight_document, features_path, name, result_format(user_id),
+                                         file_weights, percentile, RESULT_TOP_ROWS)
+            await send_rendered(context.bot, update.effective_chat.id, rendered,
+                                caption=f"⚖️ {export_name(path)}: перцентиль {percentile:g}")
+        except Exception as e:
+            await update.message.reply_text(f"⚠️ Ошибка в файле '{export_name(path)}': {e}")
+
+async def output_format(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    formats = available_formats()
+    if not context.args:
+        await update.message.reply_text(
+            f"📦 Формат результатов: {result_format(user_id)}. Доступны: {', '.join(formats)}. Пример: /format gz"
+        )
+        return
+    fmt = context.args[0].lower()
+    if fmt not in formats:
+        await update.message.reply_text(f"⚠️ Неизвестный формат '{fmt}'. Доступны: {', '.join(formats)}.")
+        return
+    user_formats[user_id] = fmt
+    await update.message.reply_text(f"📦 Результаты будут приходить в формате {fmt}.")
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     doc = update.message.document
 
-    if doc.mime_type != 'text/csv':
-        await update.message.reply_text("⚠️ Принимаю только CSV-файлы.")
+    # CSV, а также .csv.gz, .zst и .zip с одним или несколькими CSV
+    if doc.mime_type != 'text/csv' and not is_supported(doc.file_name):
+        await update.message.reply_text("⚠️ Принимаю только CSV-файлы (можно в .gz, .zst или .zip).")
         return
 
     os.makedirs(f"temp/{user_id}", exist_ok=True)
     file_path = f"temp/{user_id}/{doc.file_name}"
+    started = time.perf_counter()
     file = await doc.get_file()
     await file.download_to_drive(file_path)
+    # Провайдер архива известен только по CSV внутри; файлы без провайдера — отдельно
+    provider = provider_name(file_path) or ('archive' if file_path.lower().endswith('.zip') else 'unknown')
+    stage_stats.record(provider, 'download', time.perf_counter() - started)
 
     if user_id in user_sessions:
-        user_sessions[user_id].append(file_path)
-        await update.message.reply_text(f"📎 Файл '{doc.file_name}' получен.")
+        try:
+            exports = list_exports(file_path)
+        except Exception as e:
+            await update.message.reply_text(f"⚠️ Не удалось открыть архив '{doc.file_name}': {e}")
+            return
+        if not exports:
+            await update.message.reply_text(f"⚠️ В архиве '{doc.file_name}' нет CSV-файлов.")
+            return
+
+        for path in exports:
+            user_sessions[user_id].append(path)
+            if needs_preparse(path):
+                # Разбираем файл в фоне, пока аналитик загружает остальные
+                preparse_tasks[path] = asyncio.create_task(scoring.run(preparse_file, path))
+                preparse_tasks[path].add_done_callback(partial(preparse_finished, path))
+        if len(exports) > 1:
+            await update.message.reply_text(f"📎 Архив '{doc.file_name}' получен, CSV-файлов: {len(exports)}.")
+        else:
+            await update.message.reply_text(f"📎 Файл '{doc.file_name}' получен.")
     else:
         await update.message.reply_text("⚠️ Сначала введи /batch перед загрузкой.")
 
@@ -556,11 +404,103 @@ async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("🚫 У тебя нет прав останавливать бота.")
 
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("🚫 Статистика доступна только администратору.")
+        return
+    summary = stage_stats.summary()
+    if not summary:
+        await update.message.reply_text("📊 Замеров пока нет.")
+        return
+    lines = ["📊 Этапы по провайдерам (секунды), последние замеры:"]
+    provider = object()
+    for name, stage, count, p50, p95, rows, peak_mb in summary:
+        if name != provider:
+            provider = name
+            lines.append(f"\n{name}:")
+        line = f"  {stage}: p50 {p50:.2f}, p95 {p95:.2f} (n={count}"
+        if rows is not None:
+            line += f", строк ~{rows}"
+        if peak_mb is not None:
+            line += f", макс. RSS к этому моменту {peak_mb:.0f} МБ"
+        lines.append(line + ")")
+    await update.message.reply_text("\n".join(lines))
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global profile_next
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("🚫 Профилирование доступно только администратору.")
+        return
+    profile_next = True
+    await update.message.reply_text("🔬 Следующий файл в очереди будет посчитан под cProfile.")
+
+async def send_profile(bot, task):
+    path = profile_path(task)
+    try:
+        with open(path, "rb") as document:
+            await bot.send_document(ADMIN_ID, document=document,
+                                    caption=f"🔬 cProfile: {export_name(task['path'])} ({task['status']})")
+    except Exception as e:
+        print(f"Не удалось отправить профиль {path}: {e}")
+    finally:
+        os.remove(path)
+
+async def write_metrics():
+    while True:
+        try:
+            stage_stats.write_prometheus(METRICS_PATH)
+        except OSError as e:
+            print(f"Не удалось записать метрики {METRICS_PATH}: {e}")
+        await asyncio.sleep(METRICS_INTERVAL)
+
+def protected_paths():
+    # Загрузки незакрытого /batch и файлы в очереди; для CSV из zip — сам архив
+    paths = [path for files in user_sessions.values() for path in files] + job_queue.active_paths()
+    return [split_member(path)[0] for path in paths]
+
+async def clean_temp():
+    while True:
+        try:
+            removed, freed = await asyncio.to_thread(
+                sweep, "temp", TEMP_MAX_AGE_HOURS * 3600 or None, TEMP_QUOTA_MB * 1024 * 1024 or None,
+                protected_paths(),
+            )
+            if removed:
+                print(f"temp/: удалено файлов {removed}, освобождено {freed / 1024 / 1024:.0f} МБ")
+        except OSError as e:
+            print(f"Не удалось убрать temp/: {e}")
+        await asyncio.sleep(TEMP_SWEEP_INTERVAL)
+
+async def start_jobs(application):
+    global metrics_task, janitor_task
+    # Воркеры запускаются в фоне, бот уже принимает команды; файлы из очереди
+    # стартуют, когда forkserver прогрет
+    job_runner.start(partial(job_update, application.bot), ready=scoring.warm_up())
+    if METRICS_PATH:
+        metrics_task = asyncio.create_task(write_metrics())
+    if TEMP_SWEEP_INTERVAL:
+        janitor_task = asyncio.create_task(clean_temp())
+
+async def shutdown_scoring(application):
+    job_runner.shutdown()
+    scoring.shutdown(wait=False)
+    for task in (metrics_task, janitor_task):
+        if task is not None:
+            task.cancel()
+
 if __name__ == '__main__':
-    app = ApplicationBuilder().token(TOKEN).build()
+    # PTB по умолчанию обрабатывает апдейты по одному: пока /done или /reweight одного
+    # пользователя ждут воркер, остальные пользователи не получали бы даже ответа на /start
+    app = (ApplicationBuilder().token(TOKEN).concurrent_updates(True)
+           .post_init(start_jobs).post_shutdown(shutdown_scoring).build())
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("batch", batch))
     app.add_handler(CommandHandler("done", done))
+    app.add_handler(CommandHandler("cancel", cancel))
+    app.add_handler(CommandHandler("reweight", reweight))
+    app.add_handler(CommandHandler("format", output_format))
     app.add_handler(CommandHandler("stop", stop))
+    app.add_handler(CommandHandler("stats", stats))
+    app.add_handler(CommandHandler("profile", profile))
     app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     app.run_polling()